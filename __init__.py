@@ -2,7 +2,7 @@ bl_info = {
     "name":"Icicle Generator",
     "author":"Eoin Brennan (Mayeoin Bread)",
     "version":(2,6),
-    "blender":(2,90,0),
+    "blender":(2,91,0),
     "location":"3D View > Tools",
     "description":"Add icicles of varying widths & heights to selected non-vertical edges",
     "warning":"",
@@ -11,6 +11,8 @@ bl_info = {
     "category":"Add Mesh"
     }
 
+import sys
+
 import bpy
 
 from bpy.props import (
@@ -18,22 +20,31 @@ from bpy.props import (
     FloatProperty,
     IntProperty,
     EnumProperty,
-    PointerProperty
+    PointerProperty,
+    StringProperty
 )
 
 from bpy.types import PropertyGroup
 
 # import all teh ops and stuff
 from . ig_panel import OBJECT_PT_IciclePanel
-from . ig_gen_op import WM_OT_GenIcicle
-from . draw_op import OT_Draw_Preview
+from . ig_gen_op import WM_OT_GenIcicle, WM_OT_GenIcicleModal, WM_OT_RebuildIcicles
+from . ig_tags_op import WM_OT_DeleteIcicles, WM_OT_CountIcicles
+from . ig_export_op import WM_OT_ExportIcicles
 
 # Properties class to hold required parameters
 class IcicleProperties(PropertyGroup):
 
     def tgl_update_fnc(self, context):
         if self.preview_btn_tgl:
-            bpy.ops.wm.icicle_preview('INVOKE_DEFAULT')
+            # Drawing code (and the GPU modules) only load the first time the preview is used
+            from . import draw_op
+            draw_op.ensure_registered()
+            # The panel shows in Object mode too, but the preview needs the edit mesh
+            if bpy.ops.wm.icicle_preview.poll():
+                bpy.ops.wm.icicle_preview('INVOKE_DEFAULT')
+            else:
+                self.preview_btn_tgl = False
         return
 
     max_rad: FloatProperty(
@@ -80,6 +91,28 @@ class IcicleProperties(PropertyGroup):
         max=24
     )
 
+    adaptive_verts: BoolProperty(
+        name='Adaptive Vertices',
+        description='Work out each cone\'s base vertex count from its radius, up to Vertices',
+        default=False
+    )
+
+    target_edge: FloatProperty(
+        name='Edge Length',
+        description='Target length of the base edges of adaptive cones',
+        default=0.02,
+        min=0.0001,
+        max=1.0,
+        precision=4,
+        unit='LENGTH'
+    )
+
+    camera_lod: BoolProperty(
+        name='Camera Distance',
+        description='Scale the edge length by distance from the scene camera (Edge Length is then the length at 1 unit away)',
+        default=False
+    )
+
     subdivs: IntProperty(
         name='Subdivides',
         description='Max number of kinks on a cone',
@@ -96,6 +129,135 @@ class IcicleProperties(PropertyGroup):
         max=5000
     )
 
+    edge_source: EnumProperty(
+        name='Edges',
+        description='Which edges icicles are generated on',
+        items=[
+            ('SELECTED', 'Selected', 'The selected edges'),
+            ('AUTO', 'Overhangs', 'Find overhang edges over the whole mesh: open edges, the rims of undersides and sharp convex edges with a face dropping away below')
+        ],
+        default='SELECTED'
+    )
+
+    overhang_angle: FloatProperty(
+        name='Overhang Angle',
+        description='How far below horizontal a face must point to count as an underside, and how sharp a convex edge must be',
+        default=0.5235988,
+        min=0.0,
+        max=1.5707964,
+        subtype='ANGLE'
+    )
+
+    placement_mode: EnumProperty(
+        name='Placement',
+        description='How icicle radii are chosen along an edge',
+        items=[
+            ('RETRY', 'Retry', 'Pick any radius in range, retry (up to Iterations times) when it does not fit'),
+            ('FIT', 'Fit', 'Pick radii that always fit the remaining edge length, no retries needed')
+        ],
+        default='RETRY'
+    )
+
+    overlap_mode: EnumProperty(
+        name='Overlaps',
+        description='What to do with icicles that overlap icicles from other edges (at corners or close edges)',
+        items=[
+            ('NONE', 'Allow', 'Leave overlapping icicles as they are'),
+            ('REJECT', 'Remove', 'Remove the lower priority icicle of an overlapping pair'),
+            ('SHRINK', 'Shrink', 'Shrink the lower priority icicle to fit, removing it if it would go below Min Radius')
+        ],
+        default='NONE'
+    )
+
+    use_seed: BoolProperty(
+        name='Fixed seed',
+        description='Use a fixed random seed, the same edge always gets the same icicles',
+        default=False
+    )
+
+    seed: IntProperty(
+        name='Seed',
+        description='Random seed, mixed with each edge\'s position',
+        default=0,
+        min=0
+    )
+
+    incremental: BoolProperty(
+        name='Only rebuild changed edges',
+        description='Keep icicles on edges that haven\'t changed since the last seeded generation, only rebuild the rest',
+        default=False
+    )
+
+    use_pool: BoolProperty(
+        name='Parallel placement',
+        description='Place icicles in a pool of worker processes when there are more edges than the chunk size',
+        default=False
+    )
+
+    pool_workers: IntProperty(
+        name='Workers',
+        description='Number of worker processes, 0 uses one per CPU',
+        default=0,
+        min=0,
+        max=64
+    )
+
+    pool_chunk_size: IntProperty(
+        name='Chunk size',
+        description='Number of edges handed to each worker at a time',
+        default=5000,
+        min=100,
+        max=1000000
+    )
+
+    profile: BoolProperty(
+        name='Report timings',
+        description='Time each generation phase and report the results',
+        default=False
+    )
+
+    profile_log: StringProperty(
+        name='Timing log',
+        description='Optional file to append timings to, one JSON object per generation',
+        default='',
+        subtype='FILE_PATH'
+    )
+
+    output_mode: EnumProperty(
+        name='Output',
+        description='Where the generated icicles go',
+        items=[
+            ('EDIT', 'Edit mesh', 'Add icicles to the mesh being edited'),
+            ('OBJECT', 'Separate object', 'Write icicles to a "<name>_icicles" object parented to the source, replaced on each generation'),
+            ('INSTANCES', 'Instances', 'Write one point per icicle to a "<name>_icicles" object, with the cones instanced on them by geometry nodes (Blender 3.2+)')
+        ],
+        default='EDIT'
+    )
+
+    store_placements: BoolProperty(
+        name='Keep Placements',
+        description='Keep the icicle placements on the object (about 44 bytes an icicle), so they can be rebuilt, previewed or exported without placing again',
+        default=True
+    )
+
+    multi_object: BoolProperty(
+        name='All Selected Objects',
+        description='Generate on every selected mesh object at once, from Edit or Object mode',
+        default=False
+    )
+
+    keep_partial: BoolProperty(
+        name='Keep Partial',
+        description='Keep the icicles already made when progressive generation is cancelled with ESC. Off, they are removed and the icicles the run was replacing stay',
+        default=True
+    )
+
+    realize_instances: BoolProperty(
+        name='Realize',
+        description='Turn instanced icicles into real geometry in the modifier, needed by some exporters and tools',
+        default=False
+    )
+
     reselect_base: BoolProperty(
         name='Reselect base mesh',
         description='Reselect the base mesh after adding icicles',
@@ -104,7 +266,7 @@ class IcicleProperties(PropertyGroup):
 
     delete_previous: BoolProperty(
         name='Delete previous generations',
-        description='Deletes everything except the currently selected base mesh',
+        description='Deletes previously generated icicles (tagged geometry only) before adding new ones',
         default=False
     )
     
@@ -129,6 +291,34 @@ class IcicleProperties(PropertyGroup):
         default='Down'
     )
 
+    preview_mode: EnumProperty(
+        name='Preview',
+        description='What the preview shows',
+        items=[
+            ('RANGE', 'Range', 'Smallest and largest icicle at the middle of each edge'),
+            ('FULL', 'Placement', 'Outlines of the icicles that would be generated (seeded)'),
+            ('STORED', 'Kept', 'Outlines of the icicles already generated, from their kept placements, with the current cone settings')
+        ],
+        default='RANGE'
+    )
+
+    preview_budget: IntProperty(
+        name='Max icicles',
+        description='Most icicles drawn in the placement preview, extra ones are skipped evenly',
+        default=5000,
+        min=100,
+        max=1000000
+    )
+
+    preview_lod: FloatProperty(
+        name='Detail cutoff',
+        description='Icicles with radius smaller than this fraction of their distance from the view are drawn as a single line, 0 to always outline',
+        default=0.002,
+        min=0.0,
+        max=1.0,
+        precision=4
+    )
+
     preview_btn_tgl: BoolProperty(
         name='PreviewTgl',
         default=False,
@@ -136,7 +326,7 @@ class IcicleProperties(PropertyGroup):
         description='Toggle preview of max/min dimensions in 3D view'
     )
 
-classes = [IcicleProperties, OBJECT_PT_IciclePanel, OT_Draw_Preview, WM_OT_GenIcicle]
+classes = [IcicleProperties, OBJECT_PT_IciclePanel, WM_OT_GenIcicle, WM_OT_GenIcicleModal, WM_OT_RebuildIcicles, WM_OT_DeleteIcicles, WM_OT_CountIcicles, WM_OT_ExportIcicles]
 
 # Register/unregister classes
 def register():
@@ -147,6 +337,10 @@ def register():
 
 def unregister():
     from bpy.utils import unregister_class
+    # The preview is only registered if it was ever turned on
+    draw_op = sys.modules.get(__name__ + '.draw_op')
+    if draw_op is not None:
+        draw_op.unregister_preview()
     for cls in reversed(classes):
         unregister_class(cls)
     del bpy.types.Scene.icicle_properties
@@ -0,0 +1,146 @@
+# Benchmark for the full generator inside Blender
+#
+#   blender -b --factory-startup -P benchmarks/bench_blender.py -- [--sizes 100 1000] [--output results.json]
+#
+# Builds each synthetic mesh, selects every edge and runs WM_OT_GenIcicle on it
+# Results are written as JSON, one record per layout/size/phase
+# Memory is the peak resident size during that run or phase alone, which needs Linux
+# (/proc/self/clear_refs), elsewhere it's left out (None)
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+
+import bpy
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+import synthetic
+
+
+# Load and register the add-on straight from this checkout
+def register_addon():
+    spec = importlib.util.spec_from_file_location(
+        'icicle_generator', os.path.join(ROOT, '__init__.py'), submodule_search_locations=[ROOT]
+    )
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules['icicle_generator'] = addon
+    spec.loader.exec_module(addon)
+    addon.register()
+    return addon
+
+
+def build_object(layout, size):
+    verts, edges = synthetic.LAYOUTS[layout](size)
+    mesh = bpy.data.meshes.new('{}_{}'.format(layout, size))
+    mesh.from_pydata(verts.tolist(), edges.tolist(), [])
+    obj = bpy.data.objects.new(mesh.name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+
+def remove_object(obj):
+    mesh = obj.data
+    bpy.data.objects.remove(obj)
+    bpy.data.meshes.remove(mesh)
+
+
+def record(layout, size, phase, elapsed, icicles, verts, peak):
+    return {
+        'layout': layout,
+        'edges': size,
+        'phase': phase,
+        'seconds': elapsed,
+        'icicles': icicles,
+        'icicles_per_second': icicles / elapsed if elapsed else None,
+        'peak_rss_bytes': peak,
+        'output_verts': verts,
+    }
+
+
+def run(layout, size):
+    from icicle_generator.ig_profile import peak_rss, reset_peak_rss
+    from icicle_generator.ig_tags import GEN_TAG, ID_TAG, read_tags, count_icicles
+
+    tracked = reset_peak_rss()
+    start = time.perf_counter()
+    obj = build_object(layout, size)
+    bpy.context.view_layer.objects.active = obj
+    obj.select_set(True)
+    bpy.ops.object.mode_set(mode='EDIT')
+    bpy.ops.mesh.select_all(action='SELECT')
+    elapsed = time.perf_counter() - start
+    results = [record(layout, size, 'mesh_setup', elapsed, 0, len(obj.data.vertices), peak_rss() if tracked else None)]
+
+    base_verts = len(obj.data.vertices)
+    tracked = reset_peak_rss()
+    start = time.perf_counter()
+    bpy.ops.wm.gen_icicle()
+    elapsed = time.perf_counter() - start
+    peak = peak_rss() if tracked else None
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+    icicles, _ = count_icicles(read_tags(obj, GEN_TAG), read_tags(obj, ID_TAG))
+    results.append(record(layout, size, 'generate', elapsed, icicles, len(obj.data.vertices) - base_verts, peak))
+
+    # Break the operator time and memory down using its own profile log
+    with open(bpy.context.scene.icicle_properties.profile_log) as f:
+        profile = json.loads(f.readlines()[-1])
+    for phase, seconds in profile['phases'].items():
+        results.append(record(layout, size, 'generate.' + phase, seconds, icicles, 0, profile['peak_rss'].get(phase)))
+
+    remove_object(obj)
+    return results
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description='Benchmark WM_OT_GenIcicle in background Blender')
+    parser.add_argument('--layouts', nargs='+', default=sorted(synthetic.LAYOUTS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=synthetic.SIZES)
+    parser.add_argument('--mode', default='RETRY', choices=('RETRY', 'FIT'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file to write, prints to stdout otherwise')
+    args = parser.parse_args(argv)
+
+    addon = register_addon()
+    props = bpy.context.scene.icicle_properties
+    props.placement_mode = args.mode
+    props.use_seed = True
+    props.seed = args.seed
+    props.profile = True
+    fd, props.profile_log = tempfile.mkstemp(suffix='.jsonl')
+    os.close(fd)
+
+    results = []
+    try:
+        for layout in args.layouts:
+            for size in args.sizes:
+                results.extend(run(layout, size))
+    finally:
+        os.remove(props.profile_log)
+
+    report = {
+        'suite': 'blender',
+        'blender': bpy.app.version_string,
+        'addon_version': list(addon.bl_info['version']),
+        'numpy': np.__version__,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
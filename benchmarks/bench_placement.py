@@ -0,0 +1,101 @@
+# Benchmark for the bpy-free part of the pipeline (placement and cone geometry)
+#
+#   python benchmarks/bench_placement.py [--sizes 100 1000] [--output results.json]
+#
+# Results are written as JSON, one record per layout/size/phase
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+import synthetic
+
+# Import the add-on modules without running the package __init__ (which needs bpy)
+pkg = types.ModuleType('icicle_generator')
+pkg.__path__ = [ROOT]
+sys.modules['icicle_generator'] = pkg
+
+from icicle_generator import ig_geometry, ig_placement
+
+
+DEFAULTS = ig_placement.PlacementSettings(
+    min_rad=0.025, max_rad=0.15, min_depth=1.5, max_depth=2.0,
+    subdivs=3, max_its=50, placement_mode='RETRY'
+)
+
+
+# Run fn once, returning its result with wall time and peak traced memory
+def measure(fn, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def record(layout, size, phase, elapsed, peak, icicles, verts):
+    return {
+        'layout': layout,
+        'edges': size,
+        'phase': phase,
+        'seconds': elapsed,
+        'icicles': icicles,
+        'icicles_per_second': icicles / elapsed if elapsed else None,
+        'peak_bytes': peak,
+        'output_verts': verts,
+    }
+
+
+def run(layout, size, settings, seed):
+    verts, edges = synthetic.LAYOUTS[layout](size)
+    starts = verts[edges[:, 0]]
+    ends = verts[edges[:, 1]]
+
+    (placements, _), elapsed, peak = measure(ig_placement.place_icicles, starts, ends, settings, seed)
+    results = [record(layout, size, 'placement', elapsed, peak, len(placements), 0)]
+
+    # Fresh cache so template construction is counted too
+    ig_geometry.template_cache.clear()
+    (co, _, _, _), elapsed, peak = measure(ig_geometry.build_cones, placements, 8, 'NGON', 'Down')
+    results.append(record(layout, size, 'geometry', elapsed, peak, len(placements), len(co)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark icicle placement and geometry outside Blender')
+    parser.add_argument('--layouts', nargs='+', default=sorted(synthetic.LAYOUTS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=synthetic.SIZES)
+    parser.add_argument('--mode', default=DEFAULTS.placement_mode, choices=('RETRY', 'FIT'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file to write, prints to stdout otherwise')
+    args = parser.parse_args(argv)
+
+    settings = DEFAULTS._replace(placement_mode=args.mode)
+    results = []
+    for layout in args.layouts:
+        for size in args.sizes:
+            results.extend(run(layout, size, settings, args.seed))
+
+    report = {'suite': 'placement', 'python': sys.version.split()[0], 'numpy': np.__version__, 'results': results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
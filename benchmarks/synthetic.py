@@ -0,0 +1,45 @@
+# Synthetic edge layouts for the benchmarks, no bpy needed
+# Every layout returns (verts (n, 3), edges (m, 2)) with only non-vertical edges
+
+import numpy as np
+
+
+##
+# Rows of separate horizontal edges, like a field of gutters
+##
+def grid(num_edges, length=1.0, spacing=0.5):
+    cols = max(1, int(np.sqrt(num_edges)))
+    idx = np.arange(num_edges)
+    x = (idx % cols) * (length + spacing)
+    y = (idx // cols) * spacing
+    starts = np.stack((x, y, np.zeros(num_edges)), axis=1)
+    ends = starts + (length, 0.0, 0.0)
+    verts = np.concatenate((starts, ends))
+    edges = np.stack((idx, idx + num_edges), axis=1)
+    return verts, edges
+
+
+##
+# Closed loops of edges stacked on top of each other, like the eaves of round towers
+##
+def rings(num_edges, per_ring=64, length=1.0, spacing=3.0):
+    per_ring = min(per_ring, num_edges)
+    num_rings = -(-num_edges // per_ring)
+    radius = length / (2 * np.sin(np.pi / per_ring))
+    angle = np.arange(per_ring) * 2 * np.pi / per_ring
+    ring = np.stack((radius * np.cos(angle), radius * np.sin(angle), np.zeros(per_ring)), axis=1)
+
+    verts = np.concatenate([ring + (0.0, 0.0, r * spacing) for r in range(num_rings)])
+    local = np.arange(per_ring)
+    edges = np.concatenate([
+        np.stack((local, (local + 1) % per_ring), axis=1) + r * per_ring for r in range(num_rings)
+    ])[:num_edges]
+    return verts, edges
+
+
+LAYOUTS = {
+    'grid': grid,
+    'rings': rings,
+}
+
+SIZES = (100, 1000, 10000, 100000)
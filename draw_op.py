@@ -2,7 +2,7 @@ bl_info = {
     "name":"Icicle Generator",
     "author":"Eoin Brennan (Mayeoin Bread)",
     "version":(2,6),
-    "blender":(2,90,0),
+    "blender":(2,91,0),
     "location":"3D View > Tools",
     "description":"Add icicles of varying widths & heights to selected non-vertical edges",
     "warning":"",
@@ -11,20 +11,94 @@ bl_info = {
     "category":"Add Mesh"
     }
 
-import bpy
-import bmesh
+# Only imported once the preview is first turned on (see IcicleProperties.tgl_update_fnc),
+# so the GPU modules are never loaded in background sessions
 
-import bgl
-import blf
+import bpy
 
 import gpu
 from gpu_extras.batch import batch_for_shader
 
 from bpy.types import Operator
-import math
-import mathutils
+import numpy as np
+
+from . ig_mesh import source_edges
+from . ig_geometry import build_wireframe
+from . ig_placement import (
+    edge_keys,
+    place_icicles,
+    resolve_overlaps,
+    settings_from,
+    unpack_placements,
+    PlacementSettings
+)
+from . ig_tags import read_kept, store_holder
+
+
+##
+# Line segments outlining an icicle of the given size at each midpoint
+# Two crossed triangles (edge direction and at right angles to it) plus the square joining
+# their bases, 8 segments (16 points) per edge
+##
+def icicle_lines(mid, v_dir, rad, depth, m_dir):
+    v_r_dir = np.stack((-v_dir[:, 1], v_dir[:, 0], v_dir[:, 2]), axis=1)
+    tip = mid - np.array((0.0, 0.0, m_dir * depth))
+    a = mid + rad * v_dir
+    b = mid - rad * v_dir
+    c = mid + rad * v_r_dir
+    d = mid - rad * v_r_dir
+    segs = (a, tip, tip, b, c, tip, tip, d, a, c, c, b, b, d, d, a)
+    return np.stack(segs, axis=1).reshape(-1, 3).astype(np.float32)
+
+
+# Settings the preview depends on, a change to any of them rebuilds it
+WATCHED_PROPS = PlacementSettings._fields + (
+    'direction', 'use_seed', 'seed', 'preview_mode', 'preview_budget', 'preview_lod',
+    'edge_source', 'overhang_angle', 'overlap_mode'
+)
+
+# Vertices per cone in the placement preview, enough to show the shape and kinks
+PREVIEW_VERTS = 4
+
+
+##
+# Line segments from base to tip, for icicles too small/far away to be worth outlining
+##
+def icicle_stems(placements, m_dir):
+    tips = placements['position'] - np.outer(m_dir * placements['depth'], (0.0, 0.0, 1.0))
+    return np.stack((placements['position'], tips), axis=1).reshape(-1, 3).astype(np.float32)
+
+
+# Flat colour shader, the 3D_ prefixed name went in Blender 4.0
+def uniform_shader():
+    try:
+        return gpu.shader.from_builtin('UNIFORM_COLOR')
+    except ValueError:
+        return gpu.shader.from_builtin('3D_UNIFORM_COLOR')
+
+
+##
+# Depth tested lines for the preview, through gpu.state where there is one
+# (bgl is deprecated from 3.5 and gone in 4.0). Returns a function to put things back
+##
+def begin_lines(width):
+    if hasattr(gpu, 'state'):
+        gpu.state.depth_test_set('LESS_EQUAL')
+        gpu.state.line_width_set(width)
+        return lambda: (gpu.state.depth_test_set('NONE'), gpu.state.line_width_set(1.0))
+
+    import bgl
+    bgl.glEnable(bgl.GL_DEPTH_TEST)
+    bgl.glLineWidth(width)
+    return lambda: (bgl.glDisable(bgl.GL_DEPTH_TEST), bgl.glLineWidth(1.0))
+
+
+def tag_view3d_redraw():
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
 
-from . ig_gen_op import check_same_2d
 
 class OT_Draw_Preview(Operator):
     bl_idname = "wm.icicle_preview"
@@ -37,14 +111,23 @@ class OT_Draw_Preview(Operator):
         ob = context.object
         return (ob and ob.mode == 'EDIT')
         
-    def __init__(self):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.draw_handle_3d = None
-        self.draw_event  = None
+        self.depsgraph_handler = None
 
         self.ice_props = bpy.context.scene.icicle_properties
-        self.vert_array = []
-
-        self.create_batch()
+        self.obj = bpy.context.object
+        self.shader = uniform_shader()
+        # (colour, batch) pairs, rebuilt only when the edges or settings change
+        self.batches = []
+        self.batch_key = None
+        # Set when the edit mesh changes, edges are collected again on the next redraw
+        self.edges_dirty = True
+        self.own_update = False
+        # Placement preview, redone when the edges or placement settings change
+        self.placements = None
+        self.placement_key = None
 
     def invoke(self, context, event):
         args = (self, context)
@@ -53,27 +136,67 @@ class OT_Draw_Preview(Operator):
             self.register_handlers(args, context)
 
         context.window_manager.modal_handler_add(self)
+        tag_view3d_redraw()
         return {'RUNNING_MODAL'}
 
+    ##
+    # Redraws are driven by changes only, no timer:
+    #   msgbus subscriptions on the icicle settings
+    #   a depsgraph handler for edits/selection changes on the previewed mesh
+    ##
     def register_handlers(self, args, context):
         self.draw_handle_3d = bpy.types.SpaceView3D.draw_handler_add(
             self.draw_callback_3d, args, "WINDOW", "POST_VIEW"
         )
 
-        self.draw_event = context.window_manager.event_timer_add(0.5, window=context.window)
+        for name in WATCHED_PROPS + ('preview_btn_tgl',):
+            bpy.msgbus.subscribe_rna(
+                key=self.ice_props.path_resolve(name, False),
+                owner=self,
+                args=(name,),
+                notify=self.on_prop_change
+            )
+
+        def on_depsgraph_update(scene, depsgraph):
+            if self.own_update:
+                self.own_update = False
+                return
+            for update in depsgraph.updates:
+                if update.id.original in {self.obj, self.obj.data}:
+                    self.invalidate()
+                    break
+
+        self.depsgraph_handler = on_depsgraph_update
+        bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
 
     def unregister_handlers(self, context):
-        context.window_manager.event_timer_remove(self.draw_event)
+        bpy.msgbus.clear_by_owner(self)
+        if self.depsgraph_handler in bpy.app.handlers.depsgraph_update_post:
+            bpy.app.handlers.depsgraph_update_post.remove(self.depsgraph_handler)
 
         bpy.types.SpaceView3D.draw_handler_remove(self.draw_handle_3d, "WINDOW")
 
         self.draw_handle_3d = None
-        self.draw_event = None
+        self.depsgraph_handler = None
+        # One last redraw to clear the overlay
+        tag_view3d_redraw()
 
-    def modal(self, context, event):
-        if context.area:
-            context.area.tag_redraw()
+    def invalidate(self):
+        self.edges_dirty = True
+        tag_view3d_redraw()
+
+    def on_prop_change(self, name):
+        if name == 'preview_btn_tgl':
+            # Let the modal handler clean up on its next event
+            tag_view3d_redraw()
+            return
+        # min_rad also decides which edges are long enough
+        if name in {'min_rad', 'edge_source', 'overhang_angle'}:
+            self.edges_dirty = True
+        self.batch_key = None
+        tag_view3d_redraw()
 
+    def modal(self, context, event):
         # Check toggle button to finish showing preview
         if not self.ice_props.preview_btn_tgl:
             self.unregister_handlers(context)
@@ -87,78 +210,122 @@ class OT_Draw_Preview(Operator):
         
         return {'PASS_THROUGH'}
 
+    # Midpoints and directions (world space) of the edges to preview
     def create_batch(self):
-        obj = bpy.context.object
-        bm = bmesh.from_edit_mesh(obj.data)
-        wm = obj.matrix_world
+        # Syncing the edit mesh tags a depsgraph update, which mustn't invalidate the preview again
+        self.own_update = True
+        # Same edges (and end point order) as the generator uses
+        edge_set = source_edges(self.obj, self.ice_props)
+        self.starts = edge_set.starts
+        self.ends = edge_set.ends
+        co = np.stack((self.ends, self.starts), axis=1)
 
-        self.shader = gpu.shader.from_builtin('3D_UNIFORM_COLOR')
+        # Find midpoint of each edge to position preview of icicles
+        self.mid_points = co.mean(axis=1)
+        v_dir = co[:, 0] - co[:, 1]
+        length = np.linalg.norm(v_dir, axis=1)
+        self.v_dirs = v_dir / np.where(length > 0, length, 1)[:, None]
+        self.batch_key = None
+        self.placement_key = None
+        self.edges_dirty = False
 
-        # Get edges based on selection criteria
-        s_edges = [e for e in bm.edges if e.select and not check_same_2d(e, self.ice_props.min_rad)]
+    ##
+    # Run the real (bpy-free) placement for the current settings and seed, with overlaps
+    # settled the same way Generate does
+    # Unseeded settings still use the seed, so the preview doesn't change on every redraw
+    ##
+    def place_preview(self):
+        props = self.ice_props
+        if props.preview_mode == 'STORED':
+            # Icicles already generated, placement_key is reset when the object changes
+            if self.placement_key != 'STORED':
+                holder = store_holder(self.obj) or self.obj
+                # Reading the tags syncs the edit mesh, same as in create_batch
+                self.own_update = True
+                self.placements = unpack_placements(read_kept(holder), holder.matrix_world)[0]
+                self.placement_key = 'STORED'
+            return self.placements
 
-        # Find midpoint of each edge to position preview of icicles
-        for e in s_edges:
-            v_dir = (e.verts[0].co - e.verts[1].co).normalized() @ wm
-            mid_point = (e.verts[0].co + e.verts[1].co) * 0.5
-            self.vert_array.append((mid_point, v_dir))
+        key = (settings_from(props), props.seed, props.overlap_mode)
+        if key != self.placement_key:
+            keys = edge_keys(self.starts, self.ends)
+            placements, _ = place_icicles(self.starts, self.ends, key[0], props.seed, keys)
+            self.placements = resolve_overlaps(placements, keys, props.overlap_mode, props.min_rad)
+            self.placement_key = key
+        return self.placements
+
+    ##
+    # Lines for the placement preview, kept inside the draw budget
+    # Over budget, every n'th icicle is drawn. Icicles smaller than preview_lod (radius over
+    # distance from the view) are drawn as a single stem line instead of an outline
+    ##
+    def placement_batches(self, view_pos):
+        props = self.ice_props
+        m_dir = -1 if props.direction == 'Up' else 1
+        placements = self.place_preview()
+        if len(placements) > props.preview_budget:
+            placements = placements[::-(-len(placements) // props.preview_budget)]
+
+        dist = np.linalg.norm(placements['position'] - view_pos, axis=1)
+        small = placements['radius'] < props.preview_lod * dist
+
+        batches = []
+        if (~small).any():
+            lines = build_wireframe(placements[~small], PREVIEW_VERTS, props.direction).astype(np.float32)
+            batches.append(((0, 1, 1, 1), batch_for_shader(self.shader, 'LINES', {"pos": lines})))
+        if small.any():
+            batches.append(((0, 0, 1, 1), batch_for_shader(self.shader, 'LINES', {"pos": icicle_stems(placements[small], m_dir)})))
+        return batches
+
+    # Pack every preview line into one LINES batch per colour
+    def build_batches(self, key, view_pos):
+        self.batches = []
+        if self.ice_props.preview_mode == 'STORED' or (len(self.mid_points) and self.ice_props.preview_mode == 'FULL'):
+            self.batches = self.placement_batches(view_pos)
+        elif len(self.mid_points):
+            # Get direction
+            m_dir = -1 if self.ice_props.direction == 'Up' else 1
+            min_lines = icicle_lines(self.mid_points, self.v_dirs, self.ice_props.min_rad, self.ice_props.min_depth, m_dir)
+            max_lines = icicle_lines(self.mid_points, self.v_dirs, self.ice_props.max_rad, self.ice_props.max_depth, m_dir)
+            self.batches = [
+                ((0, 1, 1, 1), batch_for_shader(self.shader, 'LINES', {"pos": min_lines})),
+                ((0, 0, 1, 1), batch_for_shader(self.shader, 'LINES', {"pos": max_lines}))
+            ]
+        self.batch_key = key
 
     def draw_callback_3d(self, op, context):
-        shader = gpu.shader.from_builtin('3D_UNIFORM_COLOR')
-        shader.bind()
+        # Edit mesh is only there while the object is in Edit mode
+        if self.obj.mode != 'EDIT':
+            return
+        if self.edges_dirty:
+            self.create_batch()
+
+        props = self.ice_props
+        key = tuple(getattr(props, name) for name in WATCHED_PROPS)
+        view_pos = np.array(context.region_data.view_matrix.inverted().translation)
+        if props.preview_mode in {'FULL', 'STORED'} and props.preview_lod > 0:
+            # Detail levels depend on the view, redo them once it has moved a fair bit
+            cell = max(props.max_depth, 1.0) * 4
+            key += tuple(np.floor(view_pos / cell).astype(int).tolist())
+        if key != self.batch_key:
+            self.build_batches(key, view_pos)
 
         # Don't use XRay mode
-        bgl.glEnable(bgl.GL_DEPTH_TEST)
-        bgl.glLineWidth(1.5)
-
-        # Get direction
-        m_dir = -1 if self.ice_props.direction == 'Up' else 1
-
-        ra_rads = 90 * (math.pi / 180)
-
-        for mid_point, v_dir in self.vert_array:
-            v_r_dir = mathutils.Vector((
-                v_dir.x * math.cos(ra_rads) - v_dir.y * math.sin(ra_rads),
-                v_dir.x * math.sin(ra_rads) + v_dir.y * math.cos(ra_rads),
-                v_dir.z
-            ))
-            
-            shader.uniform_float('color', (0, 1, 1, 1))
-            # min size icicle
-            min_icicle = [
-                mid_point + (self.ice_props.min_rad * v_dir),
-                mid_point - (m_dir * self.ice_props.min_depth * mathutils.Vector((0, 0, 1))),
-                mid_point - (self.ice_props.min_rad * v_dir)
-            ]
-            min_icicle_r = [
-                mid_point + (self.ice_props.min_rad * v_r_dir),
-                mid_point - (m_dir * self.ice_props.min_depth * mathutils.Vector((0, 0, 1))),
-                mid_point - (self.ice_props.min_rad * v_r_dir)
-            ]
-            sq_1 = [min_icicle[0], min_icicle_r[0], min_icicle[2], min_icicle_r[2], min_icicle[0]]
-            batch = batch_for_shader(shader, 'LINE_STRIP', {"pos":min_icicle})
-            batch.draw(shader)
-            batch = batch_for_shader(shader, 'LINE_STRIP', {"pos":min_icicle_r})
-            batch.draw(shader)
-            batch = batch_for_shader(shader, 'LINE_STRIP', {"pos":sq_1})
-            batch.draw(shader)
-
-            shader.uniform_float('color', (0, 0, 1, 1))
-            # max size icicle
-            max_icicle = [
-                mid_point + (self.ice_props.max_rad * v_dir),
-                mid_point - (m_dir * self.ice_props.max_depth * mathutils.Vector((0, 0, 1))),
-                mid_point - (self.ice_props.max_rad * v_dir)
-            ]
-            max_icicle_r = [
-                mid_point + (self.ice_props.max_rad * v_r_dir),
-                mid_point - (m_dir * self.ice_props.max_depth * mathutils.Vector((0, 0, 1))),
-                mid_point - (self.ice_props.max_rad * v_r_dir)
-            ]
-            sq_2 = [max_icicle[0], max_icicle_r[0], max_icicle[2], max_icicle_r[2], max_icicle[0]]
-            batch = batch_for_shader(shader, 'LINE_STRIP', {"pos":max_icicle})
-            batch.draw(shader)
-            batch = batch_for_shader(shader, 'LINE_STRIP', {"pos":max_icicle_r})
-            batch.draw(shader)
-            batch = batch_for_shader(shader, 'LINE_STRIP', {"pos":sq_2})
-            batch.draw(shader)
+        end_lines = begin_lines(1.5)
+
+        self.shader.bind()
+        for colour, batch in self.batches:
+            self.shader.uniform_float('color', colour)
+            batch.draw(self.shader)
+        end_lines()
+
+
+# Registered on first use rather than with the rest of the add-on
+def ensure_registered():
+    if not OT_Draw_Preview.is_registered:
+        bpy.utils.register_class(OT_Draw_Preview)
+
+
+def unregister_preview():
+    if OT_Draw_Preview.is_registered:
+        bpy.utils.unregister_class(OT_Draw_Preview)
@@ -0,0 +1,243 @@
+bl_info = {
+    "name":"Icicle Generator",
+    "author":"Eoin Brennan (Mayeoin Bread)",
+    "version":(2,6),
+    "blender":(2,91,0),
+    "location":"3D View > Tools",
+    "description":"Add icicles of varying widths & heights to selected non-vertical edges",
+    "warning":"",
+    "wiki_url":"",
+    "tracker_url":"",
+    "category":"Add Mesh"
+    }
+
+# Headless batch generation over many .blend files
+#
+#   blender -b --factory-startup -P ig_batch.py -- config.json [--workers 4] [--report report.json]
+#
+# Config (JSON):
+#   files       - .blend files to process
+#   objects     - object names to generate on, every mesh object if left out
+#   edges       - 'selected' (the selection saved in the file), 'all' or 'auto' (overhang edges)
+#   properties  - IcicleProperties values, e.g. {"min_rad": 0.02, "use_seed": true, "seed": 3}
+#   output_dir  - where to save the results, the files are overwritten if left out
+#   workers     - number of Blender processes to spread the files over (default 1)
+#
+# Each file gets a record of its timings (load, generate, save and the generator's own phases),
+# the number of icicles made and any error. One file failing doesn't stop the rest
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+import bpy
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+EDGE_RULES = ('selected', 'all', 'auto')
+
+
+# Load and register the add-on straight from this folder, once per process
+def register_addon():
+    if 'icicle_generator' in sys.modules:
+        return sys.modules['icicle_generator']
+    spec = importlib.util.spec_from_file_location(
+        'icicle_generator', os.path.join(ROOT, '__init__.py'), submodule_search_locations=[ROOT]
+    )
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules['icicle_generator'] = addon
+    spec.loader.exec_module(addon)
+    addon.register()
+    return addon
+
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    if not config.get('files'):
+        raise ValueError("Config has no 'files' to process")
+    if config.get('edges', 'selected') not in EDGE_RULES:
+        raise ValueError("'edges' must be one of {}".format(', '.join(EDGE_RULES)))
+    return config
+
+
+# Set IcicleProperties values, returning the ones they replaced so they can be put back
+def apply_properties(props, values):
+    previous = {}
+    for name, value in values.items():
+        if name not in props.bl_rna.properties:
+            raise KeyError("Unknown icicle property '{}'".format(name))
+        previous[name] = getattr(props, name)
+        setattr(props, name, value)
+    return previous
+
+
+# Mesh objects to generate on, by name or every one in the view layer
+def pick_objects(view_layer, names):
+    if names is None:
+        return [obj for obj in view_layer.objects if obj.type == 'MESH' and 'icicle_source' not in obj]
+    objs = []
+    for name in names:
+        obj = view_layer.objects.get(name)
+        if obj is None or obj.type != 'MESH':
+            raise KeyError("No mesh object '{}' in the view layer".format(name))
+        objs.append(obj)
+    return objs
+
+
+def select_all_edges(mesh):
+    mesh.vertices.foreach_set('select', [True] * len(mesh.vertices))
+    mesh.edges.foreach_set('select', [True] * len(mesh.edges))
+
+
+def count_output(objs):
+    from icicle_generator.ig_tags import GEN_TAG, ID_TAG, read_tags, count_icicles
+
+    total = 0
+    for obj in objs:
+        for target in [obj] + [c for c in obj.children if c.get('icicle_source') == obj.name]:
+            total += count_icicles(read_tags(target, GEN_TAG), read_tags(target, ID_TAG))[0]
+    return total
+
+
+##
+# Load one file, generate on its objects and save it
+# Runs in this process, returns the file's record
+##
+def process_file(path, config):
+    result = {'file': path, 'ok': False, 'timings': {}, 'icicles': 0, 'error': None}
+    try:
+        start = time.perf_counter()
+        bpy.ops.wm.open_mainfile(filepath=path, load_ui=False)
+        register_addon()
+        context = bpy.context
+        if context.object is not None and context.object.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        result['timings']['load'] = time.perf_counter() - start
+
+        objs = pick_objects(context.view_layer, config.get('objects'))
+        for obj in context.view_layer.objects:
+            obj.select_set(obj in objs)
+        if objs:
+            context.view_layer.objects.active = objs[0]
+        edges = config.get('edges', 'selected')
+        if edges == 'all':
+            for obj in objs:
+                select_all_edges(obj.data)
+
+        # Every selected object in one operator call, no Edit mode or UI needed
+        values = dict(config.get('properties', {}))
+        values.update(multi_object=True, profile=True, edge_source='AUTO' if edges == 'auto' else 'SELECTED')
+        fd, values['profile_log'] = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+
+        # The file is saved with its own settings, not the ones used for the run
+        props = context.scene.icicle_properties
+        previous = {}
+        try:
+            previous = apply_properties(props, values)
+            start = time.perf_counter()
+            status = bpy.ops.wm.gen_icicle()
+            result['timings']['generate'] = time.perf_counter() - start
+            if 'FINISHED' not in status:
+                raise RuntimeError("Generate was cancelled, check the settings and objects")
+            with open(values['profile_log']) as f:
+                lines = f.readlines()
+            if lines:
+                result['timings']['phases'] = json.loads(lines[-1])['phases']
+        finally:
+            apply_properties(props, previous)
+            os.remove(values['profile_log'])
+        result['icicles'] = count_output(objs)
+
+        start = time.perf_counter()
+        output_dir = config.get('output_dir')
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            bpy.ops.wm.save_as_mainfile(filepath=os.path.join(output_dir, os.path.basename(path)), copy=True)
+        else:
+            bpy.ops.wm.save_mainfile()
+        result['timings']['save'] = time.perf_counter() - start
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+        result['traceback'] = traceback.format_exc()
+    return result
+
+
+##
+# Hand one file to a separate background Blender and collect its record
+##
+def run_worker(path, config_path):
+    fd, result_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    cmd = [bpy.app.binary_path, '-b', '--factory-startup', '-P', os.path.abspath(__file__),
+           '--', config_path, '--file', path, '--result', result_path]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    try:
+        with open(result_path) as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        result = {'file': path, 'ok': False, 'timings': {}, 'icicles': 0,
+                  'error': 'Worker exited with code {} and no result'.format(proc.returncode),
+                  'output': proc.stdout[-4000:]}
+    finally:
+        os.remove(result_path)
+    result['timings']['process'] = time.perf_counter() - start
+    return result
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description='Generate icicles over a list of .blend files')
+    parser.add_argument('config', help='JSON config file')
+    parser.add_argument('--workers', type=int, help='Blender processes to use, overrides the config')
+    parser.add_argument('--report', help='JSON file to write the report to, prints to stdout otherwise')
+    # Used by the coordinator when handing a single file to a worker
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if args.file:
+        with open(args.result, 'w') as f:
+            json.dump(process_file(args.file, config), f)
+        return
+
+    files = [os.path.abspath(p) for p in config['files']]
+    workers = args.workers or config.get('workers', 1)
+    start = time.perf_counter()
+    if workers > 1 and len(files) > 1:
+        config_path = os.path.abspath(args.config)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda p: run_worker(p, config_path), files))
+    else:
+        results = [process_file(p, config) for p in files]
+
+    report = {
+        'blender': bpy.app.version_string,
+        'workers': workers,
+        'seconds': time.perf_counter() - start,
+        'succeeded': sum(r['ok'] for r in results),
+        'failed': sum(not r['ok'] for r in results),
+        'files': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    if report['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
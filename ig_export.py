@@ -0,0 +1,123 @@
+bl_info = {
+    "name":"Icicle Generator",
+    "author":"Eoin Brennan (Mayeoin Bread)",
+    "version":(2,6),
+    "blender":(2,91,0),
+    "location":"3D View > Tools",
+    "description":"Add icicles of varying widths & heights to selected non-vertical edges",
+    "warning":"",
+    "wiki_url":"",
+    "tracker_url":"",
+    "category":"Add Mesh"
+    }
+
+# Streaming export of icicle geometry straight from placements, no bpy needed
+# Cones are built a chunk of placements at a time and written out before the next chunk,
+# so memory stays flat however many icicles there are
+
+import numpy as np
+
+from . ig_geometry import build_cones, get_template
+from . ig_placement import transform
+
+
+##
+# Cone geometry for the placements, chunk_size placements at a time
+# num_verts is one base vertex count or one per placement
+# Yields vertex co-ordinates and loops (indices into the chunk) with loop counts per face
+##
+def mesh_chunks(placements, num_verts, add_cap, direction, chunk_size=10000):
+    per_cone = np.ndim(num_verts) > 0
+    for start in range(0, len(placements), chunk_size):
+        stop = start + chunk_size
+        n = num_verts[start:stop] if per_cone else num_verts
+        co, loops, loop_counts, _ = build_cones(placements[start:stop], n, add_cap, direction)
+        yield co, loops, loop_counts
+
+
+##
+# Total vertices and faces the placements make, from the templates alone
+##
+def mesh_size(placements, num_verts, add_cap, direction):
+    topology = np.stack((np.broadcast_to(num_verts, len(placements)), placements['cuts']), axis=1)
+    verts = faces = 0
+    for (n, c), count in zip(*np.unique(topology.reshape(-1, 2), axis=0, return_counts=True)):
+        template = get_template(int(n), add_cap, int(c), direction)
+        verts += template.size * int(count)
+        faces += len(template.loop_counts) * int(count)
+    return verts, faces
+
+
+##
+# PLY face records for a chunk, a uchar vertex count then int32 indices per face
+##
+def ply_faces(loops, loop_counts):
+    sizes = 1 + 4 * loop_counts.astype(np.int64)
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    heads = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    body = np.ones(len(out), dtype=bool)
+    body[heads] = False
+    out[heads] = loop_counts
+    out[body] = np.ascontiguousarray(loops, dtype='<i4').view(np.uint8)
+    return out
+
+
+##
+# Binary little endian PLY, the header counts come from mesh_size so it's written up front
+# Co-ordinates are transformed by matrix if one is given
+# Returns the number of vertices and faces written
+##
+def write_ply(stream, placements, num_verts, add_cap, direction, matrix=None, chunk_size=10000):
+    verts, faces = mesh_size(placements, num_verts, add_cap, direction)
+    header = [
+        'ply',
+        'format binary_little_endian 1.0',
+        'comment Icicle Generator',
+        'element vertex {}'.format(verts),
+        'property float x',
+        'property float y',
+        'property float z',
+        'element face {}'.format(faces),
+        'property list uchar int vertex_indices',
+        'end_header',
+    ]
+    stream.write(('\n'.join(header) + '\n').encode('ascii'))
+
+    # Vertices come first in PLY, so the chunks are built twice rather than held on to
+    for co, _, _ in mesh_chunks(placements, num_verts, add_cap, direction, chunk_size):
+        if matrix is not None:
+            co = transform(co, matrix)
+        stream.write(np.ascontiguousarray(co, dtype='<f4').tobytes())
+    base = 0
+    for co, loops, loop_counts in mesh_chunks(placements, num_verts, add_cap, direction, chunk_size):
+        stream.write(ply_faces(loops + base, loop_counts).tobytes())
+        base += len(co)
+    return verts, faces
+
+
+##
+# Wavefront OBJ, vertices and faces written chunk by chunk (indices are 1 based and global)
+# stream is a binary file, returns the number of vertices and faces written
+##
+def write_obj(stream, placements, num_verts, add_cap, direction, matrix=None, chunk_size=10000):
+    stream.write(b'# Icicle Generator\n')
+    base = faces = 0
+    for co, loops, loop_counts in mesh_chunks(placements, num_verts, add_cap, direction, chunk_size):
+        if matrix is not None:
+            co = transform(co, matrix)
+        np.savetxt(stream, co, fmt='v %.6f %.6f %.6f')
+        # Faces of one size at a time, order doesn't matter in OBJ
+        starts = np.concatenate(([0], np.cumsum(loop_counts)[:-1]))
+        for size in np.unique(loop_counts):
+            picked = starts[loop_counts == size]
+            rows = loops[picked[:, None] + np.arange(size)] + base + 1
+            np.savetxt(stream, rows, fmt='f' + ' %d' * int(size))
+        base += len(co)
+        faces += len(loop_counts)
+    return base, faces
+
+
+def write_mesh_file(stream, fmt, *args, **kwargs):
+    if fmt == 'OBJ':
+        return write_obj(stream, *args, **kwargs)
+    return write_ply(stream, *args, **kwargs)
@@ -0,0 +1,106 @@
+bl_info = {
+    "name":"Icicle Generator",
+    "author":"Eoin Brennan (Mayeoin Bread)",
+    "version":(2,6),
+    "blender":(2,91,0),
+    "location":"3D View > Tools",
+    "description":"Add icicles of varying widths & heights to selected non-vertical edges",
+    "warning":"",
+    "wiki_url":"",
+    "tracker_url":"",
+    "category":"Add Mesh"
+    }
+
+import os
+
+import bpy
+from bpy.props import BoolProperty, EnumProperty, IntProperty, StringProperty
+from bpy_extras.io_utils import ExportHelper
+
+import numpy as np
+
+from . ig_export import write_mesh_file
+from . ig_gen_op import WM_OT_GenIcicle, generation_targets
+from . ig_placement import PLACEMENT_DTYPE, unpack_placements
+from . ig_tags import read_kept, store_holder
+
+
+##
+# Place icicles on the selected edges and stream the cones to a PLY/OBJ file
+# Nothing is added to the scene, the geometry only exists a chunk at a time
+##
+class WM_OT_ExportIcicles(ExportHelper, WM_OT_GenIcicle):
+    bl_idname = 'wm.export_icicles'
+    bl_label = 'Export Icicles'
+    bl_description = 'Write icicles for the selected edges straight to a mesh file, without adding them to the scene'
+    bl_options = {'REGISTER'}
+
+    filename_ext = '.ply'
+    filter_glob: StringProperty(default='*.ply;*.obj', options={'HIDDEN'})
+
+    format: EnumProperty(
+        name='Format',
+        items=[
+            ('PLY', 'PLY', 'Binary little endian PLY'),
+            ('OBJ', 'OBJ', 'Wavefront OBJ')
+        ],
+        default='PLY'
+    )
+
+    use_stored: BoolProperty(
+        name='Kept Placements',
+        description='Export the icicles already generated, from the placements kept on the objects, instead of placing new ones',
+        default=False
+    )
+
+    chunk_size: IntProperty(
+        name='Chunk Size',
+        description='Icicles built and written at a time, bigger is faster but uses more memory',
+        default=10000,
+        min=100
+    )
+
+    # Keep the file extension in step with the format
+    def check(self, context):
+        filepath = os.path.splitext(self.filepath)[0] + '.' + self.format.lower()
+        if filepath == self.filepath:
+            return False
+        self.filepath = filepath
+        return True
+
+    def execute(self, context):
+        self.setup(context)
+        if self.ice_prop.multi_object:
+            objs = generation_targets(context)
+        else:
+            objs = [obj for obj in [context.active_object] if obj is not None and obj.type == 'MESH']
+        if not objs:
+            self.report({'INFO'}, "No mesh objects to export icicles for")
+            return {'CANCELLED'}
+
+        # Placements are small, the cones built from them are what's streamed
+        parts = []
+        for obj in objs:
+            if self.use_stored:
+                holder = store_holder(obj)
+                if holder is not None:
+                    parts.append(unpack_placements(read_kept(holder), holder.matrix_world)[0])
+                continue
+            starts, ends, keys = self.gather(obj)
+            with self.timer.phase('placement'):
+                parts.append(self.add_icicles(starts, ends, keys, self.seed))
+        points = np.concatenate(parts) if parts else np.zeros(0, dtype=PLACEMENT_DTYPE)
+        self.timer.count('icicles_created', len(points))
+
+        with self.timer.phase('write'):
+            with open(self.filepath, 'wb') as f:
+                verts, faces = write_mesh_file(
+                    f, self.format, points, self.cone_verts(points), self.ice_prop.add_cap,
+                    self.ice_prop.direction, chunk_size=self.chunk_size
+                )
+        self.timer.count('verts_created', verts)
+
+        self.report({'INFO'}, "Exported {} icicles ({} vertices, {} faces) to {}".format(
+            len(points), verts, faces, bpy.path.basename(self.filepath)))
+        self.end(', '.join(obj.name for obj in objs))
+        return {'FINISHED'}
@@ -2,7 +2,7 @@ bl_info = {
     "name":"Icicle Generator",
     "author":"Eoin Brennan (Mayeoin Bread)",
     "version":(2,6),
-    "blender":(2,90,0),
+    "blender":(2,91,0),
     "location":"3D View > Tools",
     "description":"Add icicles of varying widths & heights to selected non-vertical edges",
     "warning":"",
@@ -15,31 +15,96 @@ import bpy
 from bpy.types import Operator
 
 import bmesh
-from mathutils import Vector
-from math import pi
-import random
+import numpy as np
+import time
+import zlib
 
+from . ig_cache import LRUCache
+from . ig_geometry import adaptive_verts, build_cones
+from . ig_profile import PhaseTimer
+from . ig_mesh import (
+    read_mesh,
+    read_int_attr,
+    base_edge_mask,
+    source_edges,
+    write_mesh,
+    output_object,
+    open_bmesh,
+    close_bmesh
+)
+from . ig_instance import (
+    MIN_VERSION as INSTANCE_VERSION,
+    supported as instancing_supported,
+    instance_attributes,
+    set_instancing,
+    clear_instancing
+)
+from . ig_placement import (
+    PLACEMENT_DTYPE,
+    edge_keys,
+    place_icicles,
+    place_icicles_parallel,
+    pack_placements,
+    unpack_placements,
+    resolve_overlaps,
+    settings_from,
+    split_keys,
+    transform
+)
+from . ig_tags import (
+    EDGE_TAG,
+    EDGE_HI_TAG,
+    SETTINGS_TAG,
+    GEN_TAG,
+    ID_TAG,
+    tag_layers,
+    read_tags,
+    read_edge_keys,
+    icicle_ids,
+    next_generation,
+    remove_verts,
+    read_kept,
+    write_store,
+    store_holder
+)
 
-def vertical_difference_check(edge):
-    # TODO update buffer at some point
-    return abs(edge.verts[0].co.z - edge.verts[1].co.z) > 0.01
+# Seeded placements per (settings, seed, edge key), so unchanged edges aren't placed again
+placement_cache = LRUCache(maxsize=100000)
 
 
-# Get z co-ordinate, used for sorting
-def get_vertex_z(vert):
-    return vert.co.z
+# Hash of every setting that changes the icicles on an edge
+def settings_key(ice_prop):
+    sig = (tuple(settings_from(ice_prop)), ice_prop.use_seed, ice_prop.seed,
+           ice_prop.num_verts, ice_prop.add_cap, ice_prop.direction,
+           ice_prop.adaptive_verts, ice_prop.target_edge, ice_prop.camera_lod, ice_prop.overlap_mode)
+    return (zlib.crc32(repr(sig).encode()) & 0x7fffffff) or 1
 
-  
-def check_same_2d(m_edge, min_rad):
-    # Return True if verts are too close together
-    e1_2d = Vector(((m_edge.verts[0].co.x, m_edge.verts[0].co.y)))
-    e2_2d = Vector(((m_edge.verts[1].co.x, m_edge.verts[1].co.y)))
-    d_2d = (e1_2d - e2_2d).length
-    
-    # Check that edge is long enough to fit the smallest cone
-    if d_2d <= 2 * min_rad:
-        return True
-    return False
+
+# Selected mesh objects to generate on, leaving out the icicle output objects
+def generation_targets(context):
+    return [obj for obj in context.selected_objects if obj.type == 'MESH' and 'icicle_source' not in obj]
+
+
+##
+# Add the vertices/faces built by ig_geometry to a bmesh in one pass
+# Co-ordinates are transformed by matrix (world -> object space) on the way in
+# tags is a dict of tag name -> per-vertex values to stamp on the new verts
+##
+def write_geometry(bm, co, loops, loop_counts, matrix, tags=None):
+    co = transform(co, matrix)
+    new_verts = [bm.verts.new(c) for c in co.tolist()]
+    layers = tag_layers(bm)
+    for name, values in (tags or {}).items():
+        layer = layers[name]
+        for v, value in zip(new_verts, values.tolist()):
+            v[layer] = value
+    loops = loops.tolist()
+    start = 0
+    for count in loop_counts.tolist():
+        bm.faces.new([new_verts[i] for i in loops[start:start + count]])
+        start += count
+    bm.normal_update()
+    return new_verts
 
 
 class WM_OT_GenIcicle(Operator):
@@ -47,195 +112,315 @@ class WM_OT_GenIcicle(Operator):
     bl_label = 'Generate Icicles'
     bl_options = {'REGISTER', 'UNDO'}
 
-    def pos_neg(self):
-        return -1 if random.random() < 0.5 else 1
+    # Run placement, in a process pool if it's turned on and there's enough edges to split up
+    def place(self, starts, ends, settings, seed, keys):
+        chunk_size = self.ice_prop.pool_chunk_size
+        if self.ice_prop.use_pool and len(starts) > chunk_size:
+            workers = self.ice_prop.pool_workers or None
+            return place_icicles_parallel(starts, ends, settings, seed, keys, chunk_size, workers, self.stats)
+        return place_icicles(starts, ends, settings, seed, keys, self.stats)
 
     ##
-    # Add cone function
+    # Add icicle function
+    # Works out where the cones go on every edge (world space end points)
     ##
-    def add_cone(self, loc_vector, base_rad, cone_depth):
-        rot = (0.0 if self.ice_prop.direction == 'Up' else pi, 0.0, 0.0)
-        loc = loc_vector + (cone_depth / 2) * Vector((0, 0, 1)) if self.ice_prop.direction == 'Up' else loc_vector - (cone_depth / 2) * Vector((0, 0, 1))
-        bpy.ops.mesh.primitive_cone_add(
-            vertices = self.ice_prop.num_verts,
-            radius1 = base_rad,
-            radius2 = 0.0,
-            depth = cone_depth,
-            end_fill_type = self.ice_prop.add_cap,
-            align = 'WORLD',
-            # Adjust the Z-height to account for the depth of the cone
-            # As pivot point is in the centre of the mesh
-            location = loc,
-            rotation = rot
-            )
+    def add_icicles(self, starts, ends, keys, seed):
+        points = self.place_all(starts, ends, keys, seed)
+        # Overlaps between edges are settled over the whole run, after any cached placements are in
+        return resolve_overlaps(points, keys, self.ice_prop.overlap_mode, self.ice_prop.min_rad, self.stats)
+
+    def place_all(self, starts, ends, keys, seed):
+        settings = settings_from(self.ice_prop)
+        if seed is None:
+            points, maxed = self.place(starts, ends, settings, None, keys)
+            self.max_its_reached |= bool(maxed.any())
+            self.timer.count('edges_maxed', int(maxed.sum()))
+            return points
+
+        # Seeded placements are repeatable, so reuse any we already have for these edges
+        cache_keys = [(settings, seed, k) for k in keys.tolist()]
+        cached = [placement_cache.get(ck) for ck in cache_keys]
+        missing = [i for i, c in enumerate(cached) if c is None]
+        if missing:
+            points, maxed = self.place(starts[missing], ends[missing], settings, seed, keys[missing])
+            bounds = np.searchsorted(points['edge'], np.arange(len(missing) + 1))
+            for j, i in enumerate(missing):
+                cached[i] = (points[bounds[j]:bounds[j + 1]], bool(maxed[j]))
+                placement_cache.put(cache_keys[i], cached[i])
+
+        if not cached:
+            return np.zeros(0, dtype=PLACEMENT_DTYPE)
+        self.max_its_reached |= any(m for _, m in cached)
+        self.timer.count('edges_maxed', sum(m for _, m in cached))
+        points = np.concatenate([p for p, _ in cached])
+        points['edge'] = np.repeat(np.arange(len(cached)), [len(p) for p, _ in cached])
+        return points
 
     ##
-    # Add icicle function
+    # Base vertex count for the cones, either the fixed setting or one per cone from its radius
+    # With the camera option the target edge length grows with distance from the scene camera
     ##
-    def add_icicles(self, context):
-        obj = context.object
-        bm = bmesh.from_edit_mesh(obj.data)
-        world_matrix = obj.matrix_world
-        self.ice_prop = context.scene.icicle_properties
-        
-        # Get the verts by checking the selected edge
-        edge_verts = [v for v in bm.verts if v.select]
-        # Make sure we only have 2 verts to use
-        if len(edge_verts) != 2:
-            print('Incorrect number of verts selected. Expected 2, found {}'.format(len(edge_verts)))
-            return
-        
-        # vertex coordinates
-        v1 = edge_verts[0].co
-        v2 = edge_verts[1].co
+    def cone_verts(self, points):
+        if not self.ice_prop.adaptive_verts:
+            return self.ice_prop.num_verts
+        length = np.full(len(points), self.ice_prop.target_edge)
+        camera = bpy.context.scene.camera
+        if self.ice_prop.camera_lod and camera is not None:
+            length *= np.linalg.norm(points['position'] - np.array(camera.matrix_world.translation), axis=1)
+        return adaptive_verts(points['radius'], length, 3, self.ice_prop.num_verts)
 
-        # World matrix for positioning
-        pos1 = world_matrix @ v1
-        pos2 = world_matrix @ v2
+    ##
+    # Build the cones for the placements, with the tags for every vertex
+    # Cone topologies come from the shared template cache, only the placement transform is per-cone
+    ##
+    def build(self, points, keys, sig):
+        with self.timer.phase('geometry'):
+            num_verts = self.cone_verts(points)
+            co, loops, loop_counts, owner = build_cones(points, num_verts, self.ice_prop.add_cap, self.ice_prop.direction)
+            low, high = split_keys(keys[points['edge'][owner]])
+            tags = {
+                EDGE_TAG: low,
+                EDGE_HI_TAG: high,
+                SETTINGS_TAG: np.full(len(owner), sig),
+                GEN_TAG: np.full(len(owner), self.generation),
+                ID_TAG: owner + 1 + self.id_base
+            }
+        self.timer.count('verts_created', len(co))
+        return co, loops, loop_counts, tags
 
-        # Total length of current edge
-        total_length = (pos1 - pos2).length
-        
-        # current length
-        c_length = 0.0
-        # Randomise the difference between radii, add it to the min and don't go over the max value
-        rad_dif = self.ice_prop.max_rad - self.ice_prop.min_rad
-        rand_rad = min(self.ice_prop.min_rad + (rad_dif * random.random()), self.ice_prop.max_rad)
-        
-        # Depth, as with radius above
-        depth_dif = self.ice_prop.max_depth - self.ice_prop.min_depth
-        rand_depth = min(self.ice_prop.min_depth + (depth_dif * random.random()), self.ice_prop.max_depth)
-
-        # Get user iterations Max
-        iterations = self.ice_prop.max_its
-        # Counter for iterations
-        c = 0
-
-        # Set up vars for the loop
-        it_rad = rand_rad
-        it_depth = rand_depth
-        wh_ratio = it_depth / it_rad
-        if wh_ratio < 1:
-            max_cuts = min(1, self.ice_prop.subdivs)
-        else:
-            max_cuts = self.ice_prop.subdivs
-        num_cuts = random.randint(0, max_cuts)
-
-        # List to hold calculated points to add cones
-        edge_points = []
-
-        while c_length < total_length:
-            # Check that 2 * min_rad can fit inside the remaining space
-            if (total_length - c_length) < (2 * self.ice_prop.min_rad):
-                break
-            # # Check depth is bigger then radius
-            # # Icicles generally longer than wider
-            # if it_depth > it_rad:
-            # Check that we won't overshoot the length of the line
-            # By using a cone of this radius
-            if c_length + (2 * it_rad) <= total_length:
-                c_length += it_rad
-                t_co = pos2 + (c_length / total_length) * (pos1 - pos2)
-                c_length += it_rad
-                # Set up a random variable to offset the subdivisions on the icicle if added
-                t_rand = min(it_rad * 0.45, it_rad) * self.pos_neg()
-                edge_points.append((t_co, it_rad, it_depth, num_cuts, t_rand))
-                # Reset iteration counter (shouldn't carry, only comes in if we're stuck on a particuar icicle)
-                c = 0
-
-            # Re-calculate values for next iteration
-            it_rad = min(self.ice_prop.min_rad + (rad_dif * random.random()), self.ice_prop.max_rad)
-            it_depth = min(self.ice_prop.min_depth + (depth_dif * random.random()), self.ice_prop.max_depth)
-            wh_ratio = it_depth / it_rad
-            if self.ice_prop.subdivs > 0:
-                if wh_ratio < 1:
-                    max_cuts = min(1, self.ice_prop.subdivs)
-                else:
-                    max_cuts = self.ice_prop.subdivs
-                num_cuts = random.randint(1, max_cuts)
+    ##
+    # Add cones function
+    # Writes every cone into the edit mesh in one go instead of one operator call per cone
+    # Kinks are built into the cone rings, so there's no subdivide/translate pass afterwards
+    ##
+    def add_cones(self, bm, points, world_matrix, keys, sig):
+        co, loops, loop_counts, tags = self.build(points, keys, sig)
+        with self.timer.phase('write'):
+            write_geometry(bm, co, loops, loop_counts, world_matrix.inverted(), tags)
+
+    ##
+    # Icicles that are out of date before an incremental regeneration
+    # Icicles whose source edge no longer exists (moved, deleted) are stale, as are icicles on
+    # the edges being generated that were made with different settings
+    # Returns a mask of the stale verts and a mask of the edges (by key) that still need icicles
+    ##
+    def find_stale(self, obj, arrays, keys, sig):
+        generated = arrays.edge_tags != 0
+        if not generated.any():
+            return generated, np.ones(len(keys), dtype=bool)
+        edge_tags = read_edge_keys(obj)
+        settings_tags = read_int_attr(obj.data, SETTINGS_TAG)
+
+        # Keys of every base edge still in the mesh
+        co = transform(arrays.co, obj.matrix_world)
+        ev = arrays.edges[base_edge_mask(arrays)]
+        live = edge_keys(co[ev[:, 0]], co[ev[:, 1]])
+
+        stale = generated & (~np.isin(edge_tags, live) | (np.isin(edge_tags, keys) & (settings_tags != sig)))
+        current = np.unique(edge_tags[generated & ~stale & (settings_tags == sig)])
+        return stale, ~np.isin(keys, current)
+
+    ##
+    # Base edges to generate on (selected or found automatically) long enough to fit
+    # the smallest cone, read and tested in bulk
+    ##
+    def gather(self, obj, arrays=None):
+        with self.timer.phase('filter'):
+            edge_set = source_edges(obj, self.ice_prop, arrays)
+        self.timer.count('edges_considered', len(edge_set.index) + edge_set.skipped)
+        self.timer.count('edges_skipped', edge_set.skipped)
+        if edge_set.skipped:
+            self.verticalEdges = True
+        return edge_set.starts, edge_set.ends, edge_keys(edge_set.starts, edge_set.ends)
+
+    ##
+    # Edges to generate on for the in-mesh output, after clearing out earlier icicles
+    # Returns the bmesh and the (world space) edge ends with their keys
+    # With defer set the earlier icicles are left in the mesh for now and remove_replaced
+    # clears them out once the new ones are in
+    ##
+    def gather_edit(self, obj, defer=False):
+        bm = open_bmesh(obj)
+        # Make sure the tag layers exist before the mesh is read
+        tag_layers(bm)
+        incremental = self.seed is not None and self.ice_prop.incremental
+
+        arrays = read_mesh(obj, EDGE_TAG)
+        starts, ends, keys = self.gather(obj, arrays)
+        # Only tagged (generated) verts go, the base mesh is never touched
+        old = None
+        if incremental and len(keys):
+            with self.timer.phase('cleanup'):
+                old, todo = self.find_stale(obj, arrays, keys, self.sig)
+            starts, ends, keys = starts[todo], ends[todo], keys[todo]
+            self.timer.count('edges_unchanged', int((~todo).sum()))
+        elif self.ice_prop.delete_previous and not incremental:
+            old = arrays.edge_tags != 0
+
+        self.replaced = np.zeros(0, dtype=np.int64)
+        if old is not None and old.any():
+            if defer:
+                self.replaced = np.unique(icicle_ids(obj)[old])
             else:
-                num_cuts = 0
-
-            # Increment by 1, check for max reached
-            c += 1
-            if c >= iterations:
-                self.max_its_reached = True
-                break
-                # print ('Maximum iterations reached on edge')
-
-        # Loop through list of calculated points and add a cone
-        # Then subdivide and shift to alter the straightness
-        for cpoint, rad, depth, cuts, offset in edge_points:
-            # Add the cone
-            self.add_cone(cpoint, rad, depth)
-            # Check that we're going to subdivide, and that we're going to shift them a noticable amount
-            if cuts > 0:  # and abs(offset) > 0.02:
-                bm.edges.ensure_lookup_table()
-                # Get the vertical edges only so we can subdivide
-                vertical_edges = [e for e in bm.edges if e.select and vertical_difference_check(e)]
-                ret = bmesh.ops.subdivide_edges(bm, edges=vertical_edges, cuts=cuts)
-                # Get the newly-generated verts so we can shift them
-                new_verts = [v for v in ret['geom_split'] if type(v) is bmesh.types.BMVert]
-                # Sort so we work from top down
-                new_verts.sort(key=get_vertex_z, reverse=True)
-                for t in range(cuts):
-                    v_z = new_verts[0].co.z
-                    bpy.ops.mesh.select_all(action='DESELECT')
-                    # add buffer of +/- 0.04 in case vert height isn't exactly exact
-                    for v in (v for v in new_verts if -0.04 < v.co.z - v_z < 0.04):
-                        v.select = True
-                    # Move the edge loop
-                    # TODO vertical offset based off (depth / num_cuts)
-                    bpy.ops.transform.translate(value=(offset, offset, 0))
-                    # Generate new offset value, and (try) make it less effective as we go down the icicle
-                    offset = offset * random.random() * abs((1-t)/cuts)
-                obj.data.update()
+                with self.timer.phase('cleanup'):
+                    remove_verts(bm, old)
+        return bm, starts, ends, keys
+
+    # Remove the earlier icicles a deferred gather_edit left in the mesh
+    def remove_replaced(self, obj, bm):
+        if len(self.replaced):
+            with self.timer.phase('cleanup'):
+                remove_verts(bm, np.isin(icicle_ids(obj), self.replaced))
 
     ##
     # Run function
     ##        
     def runIt(self, context):
         obj = context.object
-        bm = bmesh.from_edit_mesh(obj.data)
-        bm.edges.ensure_lookup_table()
-        ice_props = context.scene.icicle_properties
+        bm, starts, ends, keys = self.gather_edit(obj)
 
-        # Make sure we're in Edge select mode
-        bpy.ops.mesh.select_mode(type='EDGE')
-        
-        # List of initial edges
-        original_edges = [e for e in bm.edges if e.select]
-        if ice_props.delete_previous:
-            bpy.ops.mesh.select_all(action='INVERT')
-            bpy.ops.mesh.delete(type='EDGE')
-    
-        for idx, m_edge in enumerate(original_edges):
-            # Check for vertical edge before working on it
-            e1_2d = Vector((m_edge.verts[0].co.x, m_edge.verts[0].co.y))
-            e2_2d = Vector((m_edge.verts[1].co.x, m_edge.verts[1].co.y))
-            d_2d = (e1_2d - e2_2d).length
-            
-            # Check that edge is long enough to fit the smallest cone
-            if d_2d <= 2 * ice_props.min_rad:
-                # print("{} - Edge too small".format(idx))
+        # Placements for every edge, written to the mesh in one go afterwards
+        points = np.zeros(0, dtype=PLACEMENT_DTYPE)
+        if len(starts):
+            with self.timer.phase('placement'):
+                points = self.add_icicles(starts, ends, keys, self.seed)
+            self.timer.count('icicles_created', len(points))
+            if len(points):
+                self.generation = next_generation(obj)
+                self.add_cones(bm, points, obj.matrix_world, keys, self.sig)
+
+        # New geometry is added unselected and the base mesh isn't touched,
+        # so the initial selection is still as it was
+        with self.timer.phase('update'):
+            close_bmesh(obj, bm)
+        self.remember(obj, obj.matrix_world, points, keys)
+
+    ##
+    # Run function for every selected mesh object
+    # Edges are gathered from all of them and placed in one go, then each object's
+    # share is written to it (or its output object) in bulk. Works in Object mode too
+    ##
+    def run_multi(self, objs):
+        gathered = []
+        for obj in objs:
+            if self.ice_prop.output_mode == 'EDIT':
+                bm, starts, ends, keys = self.gather_edit(obj)
+            else:
+                bm = None
+                starts, ends, keys = self.gather(obj)
+            gathered.append((obj, bm, starts, ends, keys))
+
+        offsets = np.cumsum([0] + [len(g[4]) for g in gathered])
+        with self.timer.phase('placement'):
+            points = self.add_icicles(
+                np.concatenate([g[2] for g in gathered]).reshape(-1, 3),
+                np.concatenate([g[3] for g in gathered]).reshape(-1, 3),
+                np.concatenate([g[4] for g in gathered]).astype(np.int64),
+                self.seed
+            )
+        self.timer.count('icicles_created', len(points))
+
+        # Placements come back sorted by edge, so each object's are a contiguous run
+        bounds = np.searchsorted(points['edge'], offsets)
+        for i, (obj, bm, starts, ends, keys) in enumerate(gathered):
+            part = points[bounds[i]:bounds[i + 1]].copy()
+            part['edge'] -= offsets[i]
+            if bm is None:
+                self.write_object(obj, part, keys)
                 continue
+            if len(part):
+                self.generation = next_generation(obj)
+                self.add_cones(bm, part, obj.matrix_world, keys, self.sig)
+            with self.timer.phase('update'):
+                close_bmesh(obj, bm)
+            self.remember(obj, obj.matrix_world, part, keys)
 
-            # Deselect everything and select the current edge
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bm.edges.ensure_lookup_table()
-            m_edge.select = True
-            self.add_icicles(context)
-        
-        # Reselect the initial selection if desired
-        # if ice_props.reselect_base:
-        bpy.ops.mesh.select_all(action='DESELECT')
-        bm.edges.ensure_lookup_table()
-        for e in original_edges:
-            e.select = True
+    ##
+    # Keep the placements on the object holding their icicles, so the geometry can be rebuilt,
+    # previewed or exported later without placing again. Unless replace is set, they're added
+    # to the ones already kept for icicles still in the mesh. world_matrix is the holder's, passed
+    # in because a new output object's matrix_world isn't set until the next depsgraph update
+    ##
+    def remember(self, holder, world_matrix, points, keys, replace=False):
+        if not self.ice_prop.store_placements:
+            return
+        with self.timer.phase('store'):
+            stored = pack_placements(points, keys, self.sig, self.generation if len(points) else 0,
+                                     world_matrix.inverted())
+            if not replace:
+                kept = read_kept(holder)
+                stored = np.concatenate((kept, stored))
+            write_store(holder, stored)
 
-    def execute(self, context):
-        scene = bpy.context.scene
-        ice_prop = scene.icicle_properties
+    ##
+    # Replace the contents of obj's "_icicles" object with the given placements
+    ##
+    def write_object(self, obj, points, keys):
+        out = output_object(obj)
+        self.generation = next_generation(out)
+        if self.ice_prop.output_mode == 'INSTANCES':
+            self.write_instances(out, points, obj.matrix_world, keys, self.sig)
+
+        else:
+            co, loops, loop_counts, tags = self.build(points, keys, self.sig)
+            with self.timer.phase('write'):
+                clear_instancing(out)
+                write_mesh(out.data, transform(co, obj.matrix_world.inverted()), loops, loop_counts, tags)
+        self.remember(out, obj.matrix_world, points, keys, replace=True)
+
+    ##
+    # Run function for the separate output object
+    # All icicles for the selected edges go into the source's "_icicles" object in one write,
+    # replacing whatever was there. Works from Object mode too, no Edit mode on either object
+    ##
+    def run_to_object(self, context):
+        obj = context.object
+        starts, ends, keys = self.gather(obj)
+        with self.timer.phase('placement'):
+            points = self.add_icicles(starts, ends, keys, self.seed)
+        self.timer.count('icicles_created', len(points))
+        self.write_object(obj, points, keys)
+
+    ##
+    # Instanced output, one tagged point per icicle and the cones come from shared templates
+    # Memory goes with the number of icicles rather than the number of vertices
+    ##
+    def write_instances(self, out, points, world_matrix, keys, sig):
+        with self.timer.phase('write'):
+            attrs = instance_attributes(points, world_matrix)
+            low, high = split_keys(keys[points['edge']])
+            attrs.update({
+                EDGE_TAG: low,
+                EDGE_HI_TAG: high,
+                SETTINGS_TAG: np.full(len(points), sig),
+                GEN_TAG: np.full(len(points), self.generation),
+                ID_TAG: np.arange(1, len(points) + 1)
+            })
+            empty = np.zeros(0, dtype=np.int32)
+            write_mesh(out.data, transform(points['position'], world_matrix.inverted()), empty, empty, attrs)
+            # Templates for every kink count in the placements, which may come from older settings
+            # on a rebuild. Instance on Points wraps an index past the last one round to the first
+            set_instancing(out, self.ice_prop.num_verts, self.ice_prop.add_cap, self.ice_prop.direction,
+                           int(points['cuts'].max(initial=0)), self.ice_prop.realize_instances)
+        self.timer.count('verts_created', len(points))
+
+    # Report the profile summary, and log it if a log file is set
+    def report_profile(self, name):
+        self.timer.count('iterations_wasted', self.stats.get('wasted', 0))
+        for stat in ('overlap_dropped', 'overlap_shrunk'):
+            if stat in self.stats:
+                self.timer.count(stat, self.stats[stat])
+        self.report({'INFO'}, self.timer.summary())
+        if self.ice_prop.profile_log:
+            path = bpy.path.abspath(self.ice_prop.profile_log)
+            try:
+                self.timer.write_json(path, object=name, placement_mode=self.ice_prop.placement_mode)
+            except OSError as e:
+                self.report({'WARNING'}, "Could not write profile log: {}".format(e))
+
+    # Settings and bookkeeping for a run
+    def setup(self, context):
+        ice_prop = context.scene.icicle_properties
 
         # Check variables aren't bigger than they should be
         if ice_prop.min_rad > ice_prop.max_rad:
@@ -244,27 +429,257 @@ class WM_OT_GenIcicle(Operator):
         if ice_prop.min_depth > ice_prop.max_depth:
             ice_prop.max_depth = ice_prop.min_depth
         
+        self.ice_prop = ice_prop
+        self.seed = ice_prop.seed if ice_prop.use_seed else None
+        self.sig = settings_key(ice_prop)
         self.verticalEdges = False
         self.max_its_reached = False
+        # ID_TAG numbering carries on from here, for generations written in several parts
+        self.id_base = 0
+        # Per-phase timings/counts, only collected when profiling is turned on
+        self.timer = PhaseTimer(enabled=ice_prop.profile)
+        self.stats = {}
+
+    ##
+    # Shared set up for a run, checks the settings and the active object
+    # Returns False (having reported why) if there's nothing that can be done
+    ##
+    def begin(self, context):
+        self.setup(context)
+        ice_prop = self.ice_prop
+        if ice_prop.output_mode == 'INSTANCES' and not instancing_supported():
+            self.report({'ERROR'}, "Instanced output needs Blender {}.{} or newer".format(*INSTANCE_VERSION[:2]))
+            return False
+        if ice_prop.multi_object:
+            if not generation_targets(context):
+                self.report({'INFO'}, "No mesh objects selected")
+                return False
+            return True
 
-        # Run the function
         obj = context.active_object
-        
-        if obj and obj.type == 'MESH':
-            if obj.mode != 'EDIT':
-                self.report({'INFO'}, "Icicles cannot be added outside Edit mode")
+        if not obj or obj.type != 'MESH':
+            self.report({'INFO'}, "Cannot generate on non-Mesh object")
+            return False
+        if obj.mode != 'EDIT' and ice_prop.output_mode == 'EDIT':
+            self.report({'INFO'}, "Icicles cannot be added outside Edit mode")
+            return False
+        return True
+
+    # Warnings collected during the run, plus the profile if it's on
+    def end(self, name):
+        if self.verticalEdges:
+            self.report({'INFO'}, "Some edges were skipped during icicle creation - line too steep")
+
+        if self.max_its_reached:
+            self.report({'INFO'}, "Maximum iterations reached on some edges, may be missing some icicles")
+
+        if 'pool_failed' in self.stats:
+            self.report({'WARNING'}, "Process pool failed, placed icicles without it ({})".format(self.stats['pool_failed']))
+
+        if self.timer.enabled:
+            self.report_profile(name)
+
+    def execute(self, context):
+        if not self.begin(context):
+            return {'CANCELLED'}
+
+        # Run the function
+        if self.ice_prop.multi_object:
+            objs = generation_targets(context)
+            name = ', '.join(obj.name for obj in objs)
+        else:
+            name = context.active_object.name
+        try:
+            if self.ice_prop.multi_object:
+                self.run_multi(objs)
+            elif self.ice_prop.output_mode != 'EDIT':
+                self.run_to_object(context)
             else:
-                try:
-                    self.runIt(context)
-                except IndexError:
-                    self.report({'ERROR'}, "Issue generating icicles")
+                self.runIt(context)
+        except IndexError:
+            self.report({'ERROR'}, "Issue generating icicles")
+
+        self.end(name)
+        return {'FINISHED'}
+
+
+##
+# Rebuild the icicles from the placements kept on the object (see remember), with the
+# current cone settings (vertices, fill, direction, output). Placement isn't run again
+##
+class WM_OT_RebuildIcicles(WM_OT_GenIcicle):
+    bl_idname = 'wm.rebuild_icicles'
+    bl_label = 'Rebuild Icicles'
+    bl_description = 'Rebuild the icicles from their kept placements with the current cone settings'
+    bl_options = {'REGISTER', 'UNDO'}
 
-                if self.verticalEdges:
-                    self.report({'INFO'}, "Some edges were skipped during icicle creation - line too steep")
+    @classmethod
+    def poll(cls, context):
+        ob = context.object
+        return ob is not None and ob.type == 'MESH'
 
-                if self.max_its_reached:
-                    self.report({'INFO'}, "Maximum iterations reached on some edges, may be missing some icicles")
+    # Icicles in the object's own mesh, each generation rebuilt with its own tags
+    def rebuild_mesh(self, obj):
+        bm = open_bmesh(obj)
+        tag_layers(bm)
+        stored = read_kept(obj)
+        gen_tags = read_tags(obj, GEN_TAG)
+        with self.timer.phase('cleanup'):
+            remove_verts(bm, (gen_tags != 0) & np.isin(gen_tags, stored['generation']))
+        for gen in np.unique(stored['generation']).tolist():
+            part = stored[stored['generation'] == gen]
+            points, keys = unpack_placements(part, obj.matrix_world)
+            self.generation = gen
+            self.add_cones(bm, points, obj.matrix_world, keys, int(part['settings'][0]))
+        with self.timer.phase('update'):
+            close_bmesh(obj, bm)
+        write_store(obj, stored)
+        return len(stored)
+
+    def execute(self, context):
+        self.setup(context)
+        obj = context.active_object
+        holder = store_holder(obj)
+        if holder is None:
+            self.report({'INFO'}, "No kept placements to rebuild from, generate with Keep Placements on first")
+            return {'CANCELLED'}
+
+        if 'icicle_source' not in holder:
+            count = self.rebuild_mesh(holder)
         else:
-            self.report({'INFO'}, "Cannot generate on non-Mesh object")
-        
+            stored = read_kept(holder)
+            if self.ice_prop.output_mode == 'INSTANCES' and not instancing_supported():
+                self.report({'ERROR'}, "Instanced output needs Blender {}.{} or newer".format(*INSTANCE_VERSION[:2]))
+                return {'CANCELLED'}
+            points, keys = unpack_placements(stored, holder.matrix_world)
+            if len(stored):
+                self.sig = int(stored['settings'][0])
+            self.write_object(holder.parent, points, keys)
+            count = len(points)
+
+        self.report({'INFO'}, "Rebuilt {} icicles".format(count))
+        self.end(holder.name)
+        return {'FINISHED'}
+
+
+##
+# Same generation as WM_OT_GenIcicle, but run from a timer a chunk of icicles at a time
+# so the UI keeps redrawing and shows progress. Placement (and settling overlaps) is cheap
+# and done for every edge up front, so the result is the same as Generate's, only building
+# and writing the cones is spread out. ESC stops it, keeping what's been made
+# so far or removing it depending on the Keep Partial setting
+# Earlier icicles the run replaces (Delete previous generations, or stale ones when
+# incremental) stay in the mesh until it finishes or is stopped with Keep Partial on.
+# Removing a partial run deletes the icicles it added and leaves those alone, which puts the
+# geometry back as it was but isn't an undo: the tag layers and the generation counter stay
+##
+class WM_OT_GenIcicleModal(WM_OT_GenIcicle):
+    bl_idname = 'wm.gen_icicle_modal'
+    bl_label = 'Generate Icicles (Progressive)'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    # Seconds of work per timer event, and the icicles in the first chunk
+    budget = 0.05
+    first_chunk = 64
+    # View navigation still works while it runs, other input waits
+    passthrough = {'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'TRACKPADPAN', 'TRACKPADZOOM'}
+
+    def invoke(self, context, event):
+        if not self.begin(context):
+            return {'CANCELLED'}
+        if self.ice_prop.multi_object:
+            self.report({'INFO'}, "Progressive generation only works on the active object, use Generate for all selected")
+            return {'CANCELLED'}
+
+        self.obj = context.active_object
+        if self.ice_prop.output_mode == 'EDIT':
+            self.bm, starts, ends, self.keys = self.gather_edit(self.obj, defer=True)
+            self.generation = next_generation(self.obj)
+        else:
+            # The output object is written once, at the end
+            starts, ends, self.keys = self.gather(self.obj)
+        try:
+            with self.timer.phase('placement'):
+                self.points = self.add_icicles(starts, ends, self.keys, self.seed)
+        except IndexError:
+            self.report({'ERROR'}, "Issue generating icicles")
+            return {'CANCELLED'}
+        self.timer.count('icicles_created', len(self.points))
+        self.done = 0
+        self.chunk = self.first_chunk
+
+        wm = context.window_manager
+        wm.progress_begin(0, max(len(self.points), 1))
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    # Build and write the next chunk of icicles, resizing the chunk to fit the time budget
+    def step(self):
+        if self.ice_prop.output_mode != 'EDIT':
+            # Nothing to spread out, the output object is written in one go by stop
+            self.done = len(self.points)
+            return
+        a = self.done
+        b = min(a + self.chunk, len(self.points))
+        tick = time.perf_counter()
+        # IDs carry on from the earlier chunks, numbered as Generate would
+        self.id_base = a
+        self.add_cones(self.bm, self.points[a:b], self.obj.matrix_world, self.keys, self.sig)
+        self.done = b
+
+        elapsed = time.perf_counter() - tick
+        scale = self.budget / max(elapsed, 1e-6)
+        self.chunk = int(min(max(self.chunk * min(scale, 2.0), 16), 1 << 20))
+
+    # Stop the timer and progress, and keep or remove what's been generated
+    def stop(self, context, keep):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+
+        points = self.points[:self.done] if keep else np.zeros(0, dtype=PLACEMENT_DTYPE)
+        if self.ice_prop.output_mode == 'EDIT':
+            if keep:
+                self.remove_replaced(self.obj, self.bm)
+            else:
+                with self.timer.phase('cleanup'):
+                    remove_verts(self.bm, read_tags(self.obj, GEN_TAG) == self.generation)
+            with self.timer.phase('update'):
+                bmesh.update_edit_mesh(self.obj.data)
+            self.remember(self.obj, self.obj.matrix_world, points, self.keys)
+        elif keep:
+            self.write_object(self.obj, points, self.keys)
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            keep = self.ice_prop.keep_partial
+            self.stop(context, keep)
+            self.report({'INFO'}, "Cancelled after {} of {} icicles, {}".format(
+                self.done, len(self.points), "kept the icicles made so far" if keep else "removed them"))
+            # Only a kept result needs an undo step
+            return {'FINISHED'} if keep else {'CANCELLED'}
+
+        if event.type in self.passthrough:
+            return {'PASS_THROUGH'}
+        if event.type != 'TIMER':
+            return {'RUNNING_MODAL'}
+
+        tick = time.perf_counter()
+        try:
+            while self.done < len(self.points) and time.perf_counter() - tick < self.budget:
+                self.step()
+        except IndexError:
+            self.stop(context, False)
+            self.report({'ERROR'}, "Issue generating icicles")
+            return {'CANCELLED'}
+
+        context.window_manager.progress_update(self.done)
+        if self.ice_prop.output_mode == 'EDIT':
+            bmesh.update_edit_mesh(self.obj.data)
+
+        if self.done < len(self.points):
+            return {'RUNNING_MODAL'}
+        self.stop(context, True)
+        self.end(self.obj.name)
         return {'FINISHED'}
@@ -0,0 +1,188 @@
+bl_info = {
+    "name":"Icicle Generator",
+    "author":"Eoin Brennan (Mayeoin Bread)",
+    "version":(2,6),
+    "blender":(2,91,0),
+    "location":"3D View > Tools",
+    "description":"Add icicles of varying widths & heights to selected non-vertical edges",
+    "warning":"",
+    "wiki_url":"",
+    "tracker_url":"",
+    "category":"Add Mesh"
+    }
+
+# Geometry engine, builds the vertex/face arrays for every icicle in one pass
+# Kept free of bpy so it can be used (and timed) outside Blender
+
+from math import pi, sin, cos
+
+import numpy as np
+
+from . ig_cache import LRUCache
+
+
+# Unit circle co-ordinates for the base of the cone
+def cone_ring(num_verts):
+    step = 2 * pi / num_verts
+    return [(cos(i * step), sin(i * step)) for i in range(num_verts)]
+
+
+##
+# Topology of a single cone, same layout as primitive_cone_add(radius2=0)
+# with cuts extra rings between the base and the tip for the kinks
+# Vertex order: base ring, kink rings (num_verts each, base to tip), tip, then the cap centre for TRIFAN
+##
+def cone_faces(num_verts, add_cap, direction, cuts=0):
+    tip = (cuts + 1) * num_verts
+    # Winding is flipped for upward cones so normals still point outwards
+    up = direction == 'Up'
+    faces = []
+    for i in range(num_verts):
+        j = (i + 1) % num_verts
+        # Quads between each pair of rings
+        for k in range(cuts):
+            a = k * num_verts
+            b = a + num_verts
+            faces.append((a + i, a + j, b + j, b + i) if up else (a + j, a + i, b + i, b + j))
+        # Triangles from the last ring to the tip
+        a = cuts * num_verts
+        faces.append((a + i, a + j, tip) if up else (a + j, a + i, tip))
+
+    if add_cap == 'NGON':
+        cap = tuple(range(num_verts))
+        faces.append(cap[::-1] if up else cap)
+        return faces, tip + 1
+
+    if add_cap == 'TRIFAN':
+        centre = tip + 1
+        for i in range(num_verts):
+            j = (i + 1) % num_verts
+            faces.append((centre, j, i) if up else (centre, i, j))
+        return faces, tip + 2
+
+    return faces, tip + 1
+
+
+##
+# Kink rings for a cone, as (height fraction, radius fraction, offset fraction)
+# Rings are evenly spaced from base to tip (as subdivide_edges would place them)
+# and the sideways shift falls off towards the tip
+##
+def kink_rings(cuts):
+    return [(k / (cuts + 1), 1 - k / (cuts + 1), (cuts - k + 1) / cuts) for k in range(1, cuts + 1)]
+
+
+##
+# Unit cone for one topology, built once and instanced for every placement
+# Base ring has radius 1 at z=0 and the tip sits at z=-1 (Down) or z=1 (Up),
+# so a placement is just a scale by (radius, radius, depth) and a translation
+##
+class ConeTemplate:
+
+    def __init__(self, num_verts, add_cap, cuts, direction):
+        faces, size = cone_faces(num_verts, add_cap, direction, cuts)
+        sign = 1 if direction == 'Up' else -1
+        ring = np.array(cone_ring(num_verts))
+
+        self.size = size
+        # Index buffers, flattened the same way as Mesh loops/polygons
+        self.loop_counts = np.array([len(f) for f in faces], dtype=np.int32)
+        self.loops = np.array([i for f in faces for i in f], dtype=np.int32)
+        # Unique edges as vertex index pairs, for wireframes
+        self.edges = np.array(sorted({tuple(sorted((f[i - 1], f[i]))) for f in faces for i in range(len(f))}), dtype=np.int32)
+
+        # Unit-space co-ordinates plus how much of the placement offset each vertex gets
+        self.unit_co = np.zeros((size, 3))
+        self.kink = np.zeros(size)
+        self.unit_co[:num_verts, :2] = ring
+        for k, (h, r, o) in enumerate(kink_rings(cuts), 1):
+            ring_slice = slice(k * num_verts, (k + 1) * num_verts)
+            self.unit_co[ring_slice, :2] = ring * r
+            self.unit_co[ring_slice, 2] = sign * h
+            self.kink[ring_slice] = o
+        # Tip, the cap centre (if any) is already at the origin
+        self.unit_co[(cuts + 1) * num_verts, 2] = sign
+
+    ##
+    # Vectorized transform of the template for m placements
+    # loc (m, 3), rad/depth/offset (m,)
+    # Returns vertex co-ordinates (m * size, 3)
+    ##
+    def instance(self, loc, rad, depth, offset):
+        scale = np.stack((rad, rad, depth), axis=1)
+        co = self.unit_co[None, :, :] * scale[:, None, :] + loc[:, None, :]
+        shift = offset[:, None] * self.kink[None, :]
+        co[:, :, 0] += shift
+        co[:, :, 1] += shift
+        return co.reshape(-1, 3)
+
+    # Loops for m instances, with vertex indices starting at start
+    def instance_loops(self, m, start=0):
+        starts = start + np.arange(m, dtype=np.int32) * self.size
+        return (self.loops[None, :] + starts[:, None]).ravel()
+
+
+# Templates are shared by every edge/object in a run and kept between runs
+template_cache = LRUCache(maxsize=64)
+
+
+def get_template(num_verts, add_cap, cuts, direction, cache=template_cache):
+    key = (num_verts, add_cap, cuts, direction)
+    return cache.get_or_create(key, lambda: ConeTemplate(*key))
+
+
+##
+# Base vertex count per cone from its radius, so the base edges come out about edge_length long
+# Clamped to [min_verts, max_verts], edge_length can be per-cone (e.g. scaled by view distance)
+##
+def adaptive_verts(rad, edge_length, min_verts=3, max_verts=24):
+    n = np.ceil(2 * pi * np.asarray(rad) / np.maximum(edge_length, 1e-9))
+    return np.clip(n, min_verts, max_verts).astype(np.int32)
+
+
+##
+# Build the geometry for a placement array (see ig_placement.PLACEMENT_DTYPE)
+# num_verts is a single base vertex count or one per placement (see adaptive_verts)
+# Returns vertex co-ordinates (n, 3), loops (flat vertex indices), loop counts per face
+# and the index of the placement each vertex belongs to
+##
+def build_cones(placements, num_verts, add_cap, direction, cache=template_cache):
+    if not len(placements):
+        empty = np.zeros(0, dtype=np.int32)
+        return np.zeros((0, 3)), empty, empty, empty
+
+    topology = np.stack((np.broadcast_to(num_verts, len(placements)), placements['cuts']), axis=1)
+    co_parts = []
+    loop_parts = []
+    count_parts = []
+    owner_parts = []
+    start = 0
+    # One vectorized instance per distinct topology
+    for n, c in np.unique(topology, axis=0):
+        idx = np.flatnonzero((topology[:, 0] == n) & (topology[:, 1] == c))
+        group = placements[idx]
+        template = get_template(int(n), add_cap, int(c), direction, cache)
+        co_parts.append(template.instance(group['position'], group['radius'], group['depth'], group['offset']))
+        loop_parts.append(template.instance_loops(len(group), start))
+        count_parts.append(np.tile(template.loop_counts, len(group)))
+        owner_parts.append(np.repeat(idx, template.size))
+        start += len(group) * template.size
+
+    return (np.concatenate(co_parts), np.concatenate(loop_parts),
+            np.concatenate(count_parts), np.concatenate(owner_parts))
+
+
+##
+# Wireframe of the placements as line segment end points (2 per segment), for previews
+# Uses the edges of the same templates as build_cones
+##
+def build_wireframe(placements, num_verts, direction, cache=template_cache):
+    parts = [np.zeros((0, 3))]
+    cuts = placements['cuts']
+    for c in np.unique(cuts):
+        group = placements[cuts == c]
+        template = get_template(num_verts, 'NOTHING', int(c), direction, cache)
+        co = template.instance(group['position'], group['radius'], group['depth'], group['offset'])
+        co = co.reshape(len(group), template.size, 3)
+        parts.append(co[:, template.edges].reshape(-1, 3))
+    return np.concatenate(parts)
@@ -0,0 +1,167 @@
+bl_info = {
+    "name":"Icicle Generator",
+    "author":"Eoin Brennan (Mayeoin Bread)",
+    "version":(2,6),
+    "blender":(2,91,0),
+    "location":"3D View > Tools",
+    "description":"Add icicles of varying widths & heights to selected non-vertical edges",
+    "warning":"",
+    "wiki_url":"",
+    "tracker_url":"",
+    "category":"Add Mesh"
+    }
+
+# Instanced output: one point per icicle, turned into cones by a geometry nodes modifier
+# The point cloud carries radius, depth, rotation and variant (number of kinks) attributes,
+# and each variant is a unit cone template mesh shared by every icicle using it
+
+from math import pi
+
+import bpy
+from mathutils import Quaternion
+import numpy as np
+
+from . ig_geometry import get_template
+from . ig_mesh import write_mesh
+
+
+# Named Attribute node and the NodeTree.interface API
+MIN_VERSION = (3, 2, 0)
+MODIFIER_NAME = 'Icicle Instances'
+# Sideways kink shift in template space, placements use +/-0.45 of the radius
+KINK_OFFSET = 0.45
+
+
+def supported():
+    return bpy.app.version >= MIN_VERSION
+
+
+##
+# Unit template mesh for one variant, the same cone build_cones would make
+# for radius 1, depth 1 and a positive kink offset
+##
+def template_mesh(name, num_verts, add_cap, cuts, direction):
+    template = get_template(num_verts, add_cap, cuts, direction)
+    co = template.unit_co.copy()
+    co[:, :2] += KINK_OFFSET * template.kink[:, None]
+    mesh = bpy.data.meshes.get(name) or bpy.data.meshes.new(name)
+    write_mesh(mesh, co, template.loops, template.loop_counts)
+    return mesh
+
+
+##
+# Collection of template objects, one per variant, named so they sort by number of kinks
+# Shared by every output object made with the same cone settings
+##
+def template_collection(num_verts, add_cap, direction, max_cuts):
+    name = 'icicle_templates_{}_{}_{}'.format(num_verts, add_cap, direction)
+    collection = bpy.data.collections.get(name) or bpy.data.collections.new(name)
+    for cuts in range(max_cuts + 1):
+        obj_name = '{}_{:02d}'.format(name, cuts)
+        if obj_name in collection.objects:
+            continue
+        mesh = template_mesh(obj_name, num_verts, add_cap, cuts, direction)
+        collection.objects.link(bpy.data.objects.new(obj_name, mesh))
+    return collection
+
+
+# Geometry sockets on a node group, before and after 4.0
+def add_socket(group, name, in_out):
+    if hasattr(group, 'interface'):
+        group.interface.new_socket(name, in_out=in_out, socket_type='NodeSocketGeometry')
+    elif in_out == 'INPUT':
+        group.inputs.new('NodeSocketGeometry', name)
+    else:
+        group.outputs.new('NodeSocketGeometry', name)
+
+
+def named_attribute(nodes, name, data_type='FLOAT'):
+    node = nodes.new('GeometryNodeInputNamedAttribute')
+    node.data_type = data_type
+    node.inputs['Name'].default_value = name
+    # Pre 4.0 there's one output per data type, only the matching one is enabled
+    return next(s for s in node.outputs if s.enabled)
+
+
+##
+# Node group instancing the templates on the points, picked by the variant attribute
+# With realize on, the instances are turned into real geometry at the end
+##
+def instance_group(collection, realize):
+    name = '{}_{}'.format(collection.name, 'realized' if realize else 'instanced')
+    group = bpy.data.node_groups.get(name)
+    if group is not None:
+        return group
+
+    group = bpy.data.node_groups.new(name, 'GeometryNodeTree')
+    add_socket(group, 'Geometry', 'INPUT')
+    add_socket(group, 'Geometry', 'OUTPUT')
+    nodes, links = group.nodes, group.links
+    group_in = nodes.new('NodeGroupInput')
+    group_out = nodes.new('NodeGroupOutput')
+
+    templates = nodes.new('GeometryNodeCollectionInfo')
+    templates.inputs['Collection'].default_value = collection
+    templates.inputs['Separate Children'].default_value = True
+    templates.inputs['Reset Children'].default_value = True
+
+    scale = nodes.new('ShaderNodeCombineXYZ')
+    radius = named_attribute(nodes, 'radius')
+    links.new(radius, scale.inputs['X'])
+    links.new(radius, scale.inputs['Y'])
+    links.new(named_attribute(nodes, 'depth'), scale.inputs['Z'])
+
+    inst = nodes.new('GeometryNodeInstanceOnPoints')
+    inst.inputs['Pick Instance'].default_value = True
+    links.new(group_in.outputs[0], inst.inputs['Points'])
+    links.new(templates.outputs[0], inst.inputs['Instance'])
+    links.new(named_attribute(nodes, 'variant', 'INT'), inst.inputs['Instance Index'])
+    links.new(named_attribute(nodes, 'rotation', 'FLOAT_VECTOR'), inst.inputs['Rotation'])
+    links.new(scale.outputs[0], inst.inputs['Scale'])
+
+    result = inst.outputs[0]
+    if realize:
+        real = nodes.new('GeometryNodeRealizeInstances')
+        links.new(result, real.inputs[0])
+        result = real.outputs[0]
+    links.new(result, group_out.inputs[0])
+    return group
+
+
+##
+# Per-point attributes for the placements, in the local space of an object with matrix_world
+# Negative kink offsets are a half turn about the icicle's axis. The parent's rotation is undone
+# and its scale divided out, which is exact for uniformly scaled (or unrotated) objects
+##
+def instance_attributes(points, matrix_world):
+    rot_inv = matrix_world.to_quaternion().inverted()
+    turn = np.array(rot_inv.to_euler())
+    half_turn = np.array((rot_inv @ Quaternion((0, 0, 1), pi)).to_euler())
+
+    sx, sy, sz = matrix_world.to_scale()
+    negative = points['offset'] < 0
+    return {
+        'radius': points['radius'] / ((sx + sy) / 2),
+        'depth': points['depth'] / sz,
+        'rotation': np.where(negative[:, None], half_turn, turn),
+        'variant': points['cuts'].astype(np.int32)
+    }
+
+
+##
+# Make sure obj has the instancing modifier, using the templates for the given cone settings
+##
+def set_instancing(obj, num_verts, add_cap, direction, max_cuts, realize):
+    collection = template_collection(num_verts, add_cap, direction, max_cuts)
+    mod = obj.modifiers.get(MODIFIER_NAME)
+    if mod is None:
+        mod = obj.modifiers.new(MODIFIER_NAME, 'NODES')
+    mod.node_group = instance_group(collection, realize)
+    return mod
+
+
+# Drop the instancing modifier, for when the output goes back to plain geometry
+def clear_instancing(obj):
+    mod = obj.modifiers.get(MODIFIER_NAME)
+    if mod is not None:
+        obj.modifiers.remove(mod)
@@ -0,0 +1,191 @@
+bl_info = {
+    "name":"Icicle Generator",
+    "author":"Eoin Brennan (Mayeoin Bread)",
+    "version":(2,6),
+    "blender":(2,91,0),
+    "location":"3D View > Tools",
+    "description":"Add icicles of varying widths & heights to selected non-vertical edges",
+    "warning":"",
+    "wiki_url":"",
+    "tracker_url":"",
+    "category":"Add Mesh"
+    }
+
+# Bulk access to mesh data through foreach_get, everything comes back as NumPy arrays
+
+from collections import namedtuple
+
+import bpy
+import bmesh
+import numpy as np
+
+from . ig_placement import filter_edges, overhang_mask, transform
+
+
+# Local vertex co-ordinates (n, 3), edge vertex indices (m, 2), edge selection (m,)
+# and the source edge tag of every vertex (0 on the base mesh)
+MeshArrays = namedtuple('MeshArrays', ['co', 'edges', 'select', 'edge_tags'])
+
+
+# Write the edit mesh back to the mesh data, so foreach_get sees the current state
+def sync(obj):
+    if obj.mode == 'EDIT':
+        obj.update_from_editmode()
+
+
+##
+# bmesh for an object in either mode, the live edit mesh in Edit mode
+# and a copy of the mesh data otherwise (written back by close_bmesh)
+##
+def open_bmesh(obj):
+    if obj.mode == 'EDIT':
+        return bmesh.from_edit_mesh(obj.data)
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    return bm
+
+
+# Write an Object mode bmesh back to the mesh data, Edit mode is left to sync()
+def flush_bmesh(obj, bm):
+    if obj.mode != 'EDIT':
+        bm.to_mesh(obj.data)
+        obj.data.update()
+
+
+def close_bmesh(obj, bm):
+    if obj.mode == 'EDIT':
+        bmesh.update_edit_mesh(obj.data)
+    else:
+        flush_bmesh(obj, bm)
+        bm.free()
+
+
+def read_int_attr(mesh, name):
+    values = np.zeros(len(mesh.vertices), dtype=np.int32)
+    attr = mesh.attributes.get(name)
+    if attr is not None:
+        attr.data.foreach_get('value', values)
+    return values
+
+
+def read_mesh(obj, edge_tag='icicle_edge'):
+    sync(obj)
+    mesh = obj.data
+    co = np.zeros(len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get('co', co)
+    edges = np.zeros(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get('vertices', edges)
+    select = np.zeros(len(mesh.edges), dtype=bool)
+    mesh.edges.foreach_get('select', select)
+    return MeshArrays(co.reshape(-1, 3), edges.reshape(-1, 2), select, read_int_attr(mesh, edge_tag))
+
+
+# Edges of the base mesh, i.e. not part of a generated icicle
+def base_edge_mask(arrays):
+    return arrays.edge_tags[arrays.edges[:, 0]] == 0
+
+
+##
+# Selected base edges long enough to take icicles, as an ig_placement.EdgeSet
+# Shared by the generator and the preview
+##
+def selected_edges(obj, min_rad, arrays=None):
+    if arrays is None:
+        arrays = read_mesh(obj)
+    mask = arrays.select & base_edge_mask(arrays)
+    return filter_edges(arrays.co, arrays.edges, mask, obj.matrix_world, min_rad)
+
+
+##
+# Edge and face of every face corner, with world space face normals and centres
+# Expects the mesh already synced (read_mesh does that)
+##
+def read_faces(obj):
+    mesh = obj.data
+    loop_edges = np.zeros(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get('edge_index', loop_edges)
+    loop_totals = np.zeros(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    normals = np.zeros(len(mesh.polygons) * 3)
+    mesh.polygons.foreach_get('normal', normals)
+    centres = np.zeros(len(mesh.polygons) * 3)
+    mesh.polygons.foreach_get('center', centres)
+
+    # Normals go through the inverse transpose, so non-uniform scale doesn't skew them
+    normal_matrix = np.array(obj.matrix_world.to_3x3().inverted_safe().transposed())
+    normals = normals.reshape(-1, 3) @ normal_matrix.T
+    normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+    loop_polys = np.repeat(np.arange(len(loop_totals)), loop_totals)
+    return loop_edges, loop_polys, normals, transform(centres.reshape(-1, 3), obj.matrix_world)
+
+
+##
+# Base edges found automatically (see ig_placement.overhang_mask) rather than selected,
+# with the same length test as selected_edges
+##
+def overhang_edges(obj, min_rad, angle, arrays=None):
+    if arrays is None:
+        arrays = read_mesh(obj)
+    loop_edges, loop_polys, normals, centres = read_faces(obj)
+    world_co = transform(arrays.co, obj.matrix_world)
+    mask = overhang_mask(world_co, arrays.edges, loop_edges, loop_polys, normals, centres, angle)
+    return filter_edges(arrays.co, arrays.edges, mask & base_edge_mask(arrays), obj.matrix_world, min_rad)
+
+
+# Edges to generate on for the edge_source setting
+def source_edges(obj, props, arrays=None):
+    if props.edge_source == 'AUTO':
+        return overhang_edges(obj, props.min_rad, props.overhang_angle, arrays)
+    return selected_edges(obj, props.min_rad, arrays)
+
+
+##
+# Write per-vertex attributes in bulk, name -> values
+# Int arrays go in as INT, (n, 3) arrays as FLOAT_VECTOR and anything else as FLOAT
+##
+def write_attrs(mesh, attrs):
+    for name, values in attrs.items():
+        values = np.asarray(values)
+        if values.ndim == 2:
+            kind, prop, dtype = 'FLOAT_VECTOR', 'vector', np.float32
+        elif np.issubdtype(values.dtype, np.integer):
+            kind, prop, dtype = 'INT', 'value', np.int32
+        else:
+            kind, prop, dtype = 'FLOAT', 'value', np.float32
+        attr = mesh.attributes.get(name)
+        if attr is not None and attr.data_type != kind:
+            mesh.attributes.remove(attr)
+            attr = None
+        if attr is None:
+            attr = mesh.attributes.new(name, kind, 'POINT')
+        attr.data.foreach_set(prop, np.ascontiguousarray(values, dtype=dtype).ravel())
+
+
+##
+# Replace the geometry of a mesh with the given vertices/faces in a single from_pydata call
+# attrs is a dict of per-vertex attributes (see write_attrs) to add as well
+##
+def write_mesh(mesh, co, loops, loop_counts, attrs=None):
+    mesh.clear_geometry()
+    faces = [f.tolist() for f in np.split(loops, np.cumsum(loop_counts)[:-1])] if len(loop_counts) else []
+    mesh.from_pydata(co.tolist(), [], faces)
+    write_attrs(mesh, attrs or {})
+    mesh.update()
+
+
+##
+# The object holding a source object's generated icicles, made (and linked/parented) if needed
+# Its transform matches the source, so co-ordinates go in the source's local space
+##
+def output_object(src):
+    for child in src.children:
+        if child.get('icicle_source') == src.name and child.type == 'MESH':
+            return child
+
+    name = '{}_icicles'.format(src.name)
+    out = bpy.data.objects.new(name, bpy.data.meshes.new(name))
+    out['icicle_source'] = src.name
+    for collection in src.users_collection:
+        collection.objects.link(out)
+    out.parent = src
+    return out
@@ -2,7 +2,7 @@ bl_info = {
     "name":"Icicle Generator",
     "author":"Eoin Brennan (Mayeoin Bread)",
     "version":(2,6),
-    "blender":(2,90,0),
+    "blender":(2,91,0),
     "location":"3D View > Tools",
     "description":"Add icicles of varying widths & heights to selected non-vertical edges",
     "warning":"",
@@ -11,7 +11,6 @@ bl_info = {
     "category":"Add Mesh"
     }
 
-import bpy_types
 from bpy.types import Panel
 
 class OBJECT_PT_IciclePanel(Panel):
@@ -20,11 +19,11 @@ class OBJECT_PT_IciclePanel(Panel):
     bl_space_type = 'VIEW_3D'
     bl_region_type = 'UI'
     bl_category = 'Icicle Generator'
-    bl_context = 'mesh_edit'
 
     @classmethod
     def poll(self, context):
-        return context.object is not None
+        # Object mode too, for generating on several objects or into an output object
+        return context.object is not None and context.mode in {'EDIT_MESH', 'OBJECT'}
 
     def draw(self, context):
         layout = self.layout
@@ -50,19 +49,80 @@ class OBJECT_PT_IciclePanel(Panel):
         col.label(text='Cap')
         col.prop(icicle_props, 'num_verts')
         col.prop(icicle_props, 'add_cap')
+        col.prop(icicle_props, 'adaptive_verts')
+        sub = col.column(align=True)
+        sub.active = icicle_props.adaptive_verts
+        sub.prop(icicle_props, 'target_edge')
+        sub.prop(icicle_props, 'camera_lod')
 
         row = layout.row()
         
-        layout.prop(icicle_props, 'max_its')
+        col = layout.column(align=True)
+        col.prop(icicle_props, 'edge_source')
+        sub = col.column(align=True)
+        sub.active = icicle_props.edge_source == 'AUTO'
+        sub.prop(icicle_props, 'overhang_angle')
+
+        layout.prop(icicle_props, 'placement_mode')
+        row = layout.row()
+        row.active = icicle_props.placement_mode == 'RETRY'
+        row.prop(icicle_props, 'max_its')
+        layout.prop(icicle_props, 'overlap_mode')
 
         # layout.prop(icicle_props, 'reselect_base')
 
-        layout.prop(icicle_props, 'delete_previous')
+        col = layout.column(align=True)
+        col.prop(icicle_props, 'use_seed')
+        sub = col.column(align=True)
+        sub.active = icicle_props.use_seed
+        sub.prop(icicle_props, 'seed')
+        sub.prop(icicle_props, 'incremental')
+
+        col = layout.column(align=True)
+        col.prop(icicle_props, 'use_pool')
+        sub = col.column(align=True)
+        sub.active = icicle_props.use_pool
+        sub.prop(icicle_props, 'pool_workers')
+        sub.prop(icicle_props, 'pool_chunk_size')
+
+        col = layout.column(align=True)
+        col.prop(icicle_props, 'profile')
+        sub = col.column(align=True)
+        sub.active = icicle_props.profile
+        sub.prop(icicle_props, 'profile_log', text='')
+
+        row = layout.row()
+        row.active = not (icicle_props.use_seed and icicle_props.incremental)
+        row.prop(icicle_props, 'delete_previous')
+        layout.prop(icicle_props, 'store_placements')
 
         layout.prop(icicle_props, 'direction')
 
+        col = layout.column(align=True)
+        col.prop(icicle_props, 'output_mode')
+        sub = col.column(align=True)
+        sub.active = icicle_props.output_mode == 'INSTANCES'
+        sub.prop(icicle_props, 'realize_instances')
+
+        col = layout.column(align=True)
+        col.prop(icicle_props, 'preview_mode')
+        sub = col.column(align=True)
+        sub.active = icicle_props.preview_mode in {'FULL', 'STORED'}
+        sub.prop(icicle_props, 'preview_budget')
+        sub.prop(icicle_props, 'preview_lod')
+
         label = "Preview On" if icicle_props.preview_btn_tgl else "Preview Off"
         layout.prop(icicle_props, 'preview_btn_tgl', text=label, toggle=True, icon='GPBRUSH_PEN')
 
-        row = layout.row()
+        layout.prop(icicle_props, 'multi_object')
+        row = layout.row(align=True)
         row.operator('wm.gen_icicle', text='Generate', icon='PHYSICS')
+        row.operator('wm.gen_icicle_modal', text='Progressive', icon='TIME')
+        layout.prop(icicle_props, 'keep_partial')
+
+        row = layout.row(align=True)
+        row.operator_menu_enum('wm.delete_icicles', 'scope', text='Delete', icon='TRASH')
+        row.operator('wm.count_icicles', text='Count', icon='INFO')
+        row.operator('wm.rebuild_icicles', text='Rebuild', icon='FILE_REFRESH')
+
+        layout.operator('wm.export_icicles', text='Export to File', icon='EXPORT')
@@ -0,0 +1,549 @@
+bl_info = {
+    "name":"Icicle Generator",
+    "author":"Eoin Brennan (Mayeoin Bread)",
+    "version":(2,6),
+    "blender":(2,91,0),
+    "location":"3D View > Tools",
+    "description":"Add icicles of varying widths & heights to selected non-vertical edges",
+    "warning":"",
+    "wiki_url":"",
+    "tracker_url":"",
+    "category":"Add Mesh"
+    }
+
+# Placement engine, works out where every icicle goes along a set of edges
+# No bpy (or package) imports here so it can be run and tested in plain Python
+
+from collections import namedtuple
+from contextlib import contextmanager
+import os
+import sys
+
+import numpy as np
+
+
+# One record per icicle, position is in world space and edge is the index of the source edge
+PLACEMENT_DTYPE = np.dtype([
+    ('position', np.float64, 3),
+    ('radius', np.float64),
+    ('depth', np.float64),
+    ('cuts', np.int32),
+    ('offset', np.float64),
+    ('edge', np.int32),
+])
+
+# Compact record for keeping placements with the mesh, 44 bytes an icicle
+# Position is in the local space of the object holding the icicles, so they follow it when it's
+# moved. Edge is the source edge's key rather than an index, settings/generation are the tags
+# the icicle's verts were given
+STORED_DTYPE = np.dtype([
+    ('position', np.float32, 3),
+    ('radius', np.float32),
+    ('depth', np.float32),
+    ('offset', np.float32),
+    ('edge', np.int64),
+    ('cuts', np.int32),
+    ('settings', np.int32),
+    ('generation', np.int32),
+])
+
+# The IcicleProperties values that placement depends on
+PlacementSettings = namedtuple('PlacementSettings', [
+    'min_rad', 'max_rad', 'min_depth', 'max_depth', 'subdivs', 'max_its', 'placement_mode'
+])
+
+
+# Pull the placement values out of IcicleProperties (or anything with the same attributes)
+def settings_from(props):
+    return PlacementSettings(*(getattr(props, f) for f in PlacementSettings._fields))
+
+
+# Edges that passed filter_edges: their indices in the mesh, world space end points
+# (start/end in the order the generator walks them) and how many were too short/steep
+EdgeSet = namedtuple('EdgeSet', ['index', 'starts', 'ends', 'skipped'])
+
+
+# Apply a 4x4 matrix (anything NumPy can convert) to (n, 3) co-ordinates
+def transform(co, matrix):
+    mat = np.array(matrix, dtype=np.float64)
+    return np.asarray(co, dtype=np.float64) @ mat[:3, :3].T + mat[:3, 3]
+
+
+##
+# Filter edges in one pass
+# co are local vertex co-ordinates, edges (m, 2) vertex indices and mask picks the candidates
+# An edge passes if it is long enough (in plan view, world space) to fit the smallest cone,
+# which also rules out vertical and steep edges
+##
+def filter_edges(co, edges, mask, matrix, min_rad):
+    world = transform(co, matrix)
+    idx = np.flatnonzero(mask)
+    a = world[edges[idx, 0]]
+    b = world[edges[idx, 1]]
+    long_enough = np.linalg.norm((a - b)[:, :2], axis=1) > 2 * min_rad
+    return EdgeSet(idx[long_enough], b[long_enough], a[long_enough], int(len(idx) - long_enough.sum()))
+
+
+##
+# Edges icicles would hang from, found over the whole mesh at once
+# world_co are world space vertex co-ordinates, edges (m, 2) vertex indices, loop_edges and
+# loop_polys the edge and face of every face corner, normals/centres world space per face.
+# An edge is a candidate if it's
+#   a boundary edge (one face)
+#   the rim of an underside, one face points down more than angle below horizontal and the other doesn't
+#   a convex edge bending more than angle, where the steeper face drops away below the edge
+##
+def overhang_mask(world_co, edges, loop_edges, loop_polys, normals, centres, angle):
+    m = len(edges)
+    faces = np.bincount(loop_edges, minlength=m)
+    mask = faces == 1
+
+    # The two faces of every manifold edge, from the corners sorted by edge
+    order = np.argsort(loop_edges, kind='stable')
+    first = np.searchsorted(loop_edges[order], np.arange(m))
+    pair = np.flatnonzero(faces == 2)
+    fa = loop_polys[order[first[pair]]]
+    fb = loop_polys[order[first[pair] + 1]]
+    na, nb = normals[fa], normals[fb]
+
+    down = -np.sin(angle)
+    rim = (na[:, 2] < down) != (nb[:, 2] < down)
+
+    # Convex if each face is behind the other's plane, lower is the face pointing further down
+    convex = np.einsum('ij,ij->i', centres[fb] - centres[fa], na) < 0
+    bend = np.einsum('ij,ij->i', na, nb) < np.cos(angle)
+    lower = np.where(na[:, 2] < nb[:, 2], fa, fb)
+    mid_z = world_co[edges[pair]].mean(axis=1)[:, 2]
+    drops = centres[lower, 2] < mid_z
+
+    mask[pair] = rim | (convex & bend & drops)
+    return mask
+
+
+# Grid used to snap co-ordinates before hashing, so float noise doesn't change an edge's key
+KEY_QUANTUM = 1e-4
+
+
+# splitmix64 finaliser, works on uint64 arrays (overflow wraps, which is what we want)
+def mix64(x):
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def quantize(co):
+    return np.round(np.asarray(co, dtype=np.float64) / KEY_QUANTUM).astype(np.int64)
+
+
+def hash_points(co):
+    q = quantize(co).view(np.uint64)
+    h = mix64(q[..., 0])
+    h = mix64(h ^ q[..., 1])
+    return mix64(h ^ q[..., 2])
+
+
+##
+# Stable key for each edge from its (world space) end points
+# Doesn't depend on vertex order or index, so it survives other geometry being added/removed
+# Keys are odd 62 bit ints, wide enough that edges don't share one however many there are.
+# split_keys turns them into two int attribute values, the low one never 0 (0 is "not an icicle")
+##
+def edge_keys(starts, ends):
+    ha = hash_points(np.asarray(starts).reshape(-1, 3))
+    hb = hash_points(np.asarray(ends).reshape(-1, 3))
+    h = mix64(np.minimum(ha, hb) ^ mix64(np.maximum(ha, hb)))
+    return ((h >> np.uint64(2)) | np.uint64(1)).astype(np.int64)
+
+
+# Low and high 31 bits of edge keys, for int attributes
+def split_keys(keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    return (keys & 0x7fffffff).astype(np.int32), (keys >> 31).astype(np.int32)
+
+
+def join_keys(low, high):
+    return (np.asarray(high, dtype=np.int64) << 31) | np.asarray(low, dtype=np.int64)
+
+
+##
+# Counter based random numbers with one independent stream per edge
+# An edge's numbers only depend on the seed and its key, not on which other edges are
+# placed alongside it, so results are repeatable edge by edge
+##
+class EdgeRandom:
+
+    def __init__(self, keys, seed):
+        keys = np.asarray(keys, dtype=np.int64).view(np.uint64)
+        self.state = mix64(keys ^ mix64(np.full(len(keys), seed, dtype=np.uint64)))
+        self.counter = np.zeros(len(keys), dtype=np.uint64)
+
+    # One uniform [0, 1) value for each of the given edges
+    def random(self, edges):
+        x = mix64(self.state[edges] + self.counter[edges] * np.uint64(0x9E3779B97F4A7C15))
+        self.counter[edges] += np.uint64(1)
+        return (x >> np.uint64(11)).astype(np.float64) * (1.0 / 2**53)
+
+    # Integers in [low, high], inclusive like random.randint
+    def integers(self, edges, low, high):
+        return np.floor(low + self.random(edges) * (high - low + 1)).astype(np.int64)
+
+
+def random_seed():
+    return int.from_bytes(os.urandom(8), 'little')
+
+
+##
+# Random radius/depth/cuts for the next icicle on each of the given edges
+# Depth must be bigger than radius to get more than one kink
+##
+def random_dimensions(rng, edges, settings, min_cuts):
+    rad = settings.min_rad + (settings.max_rad - settings.min_rad) * rng.random(edges)
+    depth = settings.min_depth + (settings.max_depth - settings.min_depth) * rng.random(edges)
+    if settings.subdivs > 0:
+        max_cuts = np.where(depth / rad < 1, min(1, settings.subdivs), settings.subdivs)
+        cuts = rng.integers(edges, min_cuts, max_cuts)
+    else:
+        cuts = np.zeros(len(edges), dtype=np.int64)
+    return rad, depth, cuts
+
+
+##
+# Placement records for the icicles accepted this step
+##
+def make_records(rng, edges, centre, starts, direction, total, rad, depth, cuts):
+    rec = np.zeros(len(edges), dtype=PLACEMENT_DTYPE)
+    rec['position'] = starts[edges] + (centre / total[edges])[:, None] * direction[edges]
+    rec['radius'] = rad
+    rec['depth'] = depth
+    rec['cuts'] = cuts
+    # Sideways shift for the kinks, in a random direction
+    rec['offset'] = rad * 0.45 * np.where(rng.random(edges) < 0.5, -1, 1)
+    rec['edge'] = edges
+    return rec
+
+
+##
+# Place icicles along every edge at once
+# starts/ends are (n, 3) arrays of edge end points, icicles are placed from start towards end
+# settings.placement_mode picks how radii are drawn:
+#   RETRY - any radius in range, a candidate that doesn't fit in the remaining length is
+#           thrown away and an edge gives up after max_its misses in a row
+#   FIT   - radius is drawn from the part of the range that fits the remaining length,
+#           so every draw is used and max_its is never needed
+# Each edge gets its own random stream from seed and its key (edge_keys by default), and
+# edges are walked from their lower end point, so the same edge with the same seed always
+# gets the same icicles. No seed means a fresh random one
+# Returns the placements (sorted by edge, then along the edge) and a mask of the edges
+# that hit max_its. If a stats dict is passed, the number of thrown away candidates is
+# added to stats['wasted']
+##
+def place_icicles(starts, ends, settings, seed=None, keys=None, stats=None):
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 3)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 3)
+    n = len(starts)
+    if keys is None:
+        keys = edge_keys(starts, ends)
+    rng = EdgeRandom(keys, random_seed() if seed is None else seed)
+
+    # Same direction along an edge whichever way round its verts are
+    diff = quantize(ends) - quantize(starts)
+    swap = diff[np.arange(n), np.argmax(diff != 0, axis=1)] < 0
+    starts, ends = np.where(swap[:, None], ends, starts), np.where(swap[:, None], starts, ends)
+
+    direction = ends - starts
+    total = np.linalg.norm(direction, axis=1)
+    c_length = np.zeros(n)
+    misses = np.zeros(n, dtype=np.int64)
+    maxed = np.zeros(n, dtype=bool)
+    fit = settings.placement_mode == 'FIT'
+
+    # First candidate can have no kinks, later ones always get at least one (if enabled)
+    rad, depth, cuts = random_dimensions(rng, np.arange(n), settings, 0)
+    min_cuts = min(1, settings.subdivs)
+
+    active = np.flatnonzero(total > 0)
+    found = []
+    wasted = 0
+    step = 0
+    while len(active):
+        # Stop once the smallest cone can't fit inside the remaining space
+        remaining = total[active] - c_length[active]
+        keep = remaining >= 2 * settings.min_rad
+        active = active[keep]
+        if not len(active):
+            break
+
+        if fit:
+            # Squeeze the radius into [min_rad, min(max_rad, remaining / 2)]
+            upper = np.minimum(settings.max_rad, remaining[keep] / 2)
+            rad[active] = settings.min_rad + (upper - settings.min_rad) * rng.random(active)
+            hit = active
+        else:
+            # Check that we won't overshoot the length of the line by using a cone of this radius
+            hit = active[c_length[active] + 2 * rad[active] <= total[active]]
+            wasted += len(active) - len(hit)
+
+        if len(hit):
+            rec = make_records(rng, hit, c_length[hit] + rad[hit], starts, direction, total, rad[hit], depth[hit], cuts[hit])
+            found.append((np.full(len(hit), step), rec))
+            c_length[hit] += 2 * rad[hit]
+            # Reset iteration counter, only counts misses in a row
+            misses[hit] = 0
+
+        # Re-calculate values for next iteration
+        rad[active], depth[active], cuts[active] = random_dimensions(rng, active, settings, min_cuts)
+
+        if not fit:
+            misses[active] += 1
+            gave_up = misses[active] >= settings.max_its
+            maxed[active[gave_up]] = True
+            active = active[~gave_up]
+        step += 1
+
+    if stats is not None:
+        stats['wasted'] = stats.get('wasted', 0) + wasted
+    if not found:
+        return np.zeros(0, dtype=PLACEMENT_DTYPE), maxed
+
+    steps = np.concatenate([f[0] for f in found])
+    placements = np.concatenate([f[1] for f in found])
+    order = np.lexsort((steps, placements['edge']))
+    return placements[order], maxed
+
+
+##
+# Stored records for placements, matrix takes their positions from world to the holder's local space
+##
+def pack_placements(placements, keys, settings=0, generation=0, matrix=None):
+    stored = np.zeros(len(placements), dtype=STORED_DTYPE)
+    for name in ('position', 'radius', 'depth', 'offset', 'cuts'):
+        stored[name] = placements[name]
+    if matrix is not None:
+        stored['position'] = transform(placements['position'], matrix)
+    stored['edge'] = np.asarray(keys)[placements['edge']]
+    stored['settings'] = settings
+    stored['generation'] = generation
+    return stored
+
+
+##
+# Back to a placement array (sorted by edge) and the keys its edge indices refer to
+# matrix is the holder's current world matrix, to put the positions back in world space
+##
+def unpack_placements(stored, matrix=None):
+    keys, edge = np.unique(stored['edge'], return_inverse=True)
+    placements = np.zeros(len(stored), dtype=PLACEMENT_DTYPE)
+    for name in ('position', 'radius', 'depth', 'offset', 'cuts'):
+        placements[name] = stored[name]
+    if matrix is not None:
+        placements['position'] = transform(placements['position'], matrix)
+    placements['edge'] = edge
+    return placements[np.argsort(edge, kind='stable')], keys.astype(np.int64)
+
+
+# Flat int32 form of stored placements, for ID property arrays
+def stored_to_ints(stored):
+    return np.ascontiguousarray(stored).view(np.int32)
+
+
+def ints_to_stored(ints):
+    return np.ascontiguousarray(ints, dtype=np.int32).view(STORED_DTYPE)
+
+
+##
+# Stored placements whose icicles are still in the mesh, going by the verts' tags
+# vert_keys are the verts' full edge keys (join_keys), numbered so they pair up with the generation
+##
+def prune_stored(stored, gen_tags, vert_keys):
+    live = gen_tags != 0
+    _, index = np.unique(np.concatenate((stored['edge'], vert_keys[live])), return_inverse=True)
+    present = np.unique((gen_tags[live].astype(np.int64) << 32) | index[len(stored):])
+    pairs = (stored['generation'].astype(np.int64) << 32) | index[:len(stored)]
+    return stored[np.isin(pairs, present)]
+
+
+# One int per cell of a uniform XY grid
+def cell_hash(ix, iy):
+    return (ix.astype(np.int64) << 32) ^ (iy.astype(np.int64) & 0xffffffff)
+
+
+##
+# Pairs of placements (i < j) from different edges whose cones overlap
+# Placements are hashed into an XY grid with cells as wide as the biggest cone, so only
+# the 3x3 block of cells around each one needs looking at. Cones overlap if their base
+# circles do in plan view and they're closer in height than the deeper of the two
+##
+def overlap_pairs(placements):
+    n = len(placements)
+    pos = placements['position']
+    rad = placements['radius']
+    cells = np.floor(pos[:, :2] / (2 * rad.max())).astype(np.int64)
+    hashes = cell_hash(cells[:, 0], cells[:, 1])
+    order = np.argsort(hashes, kind='stable')
+    sorted_hashes = hashes[order]
+
+    pairs = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            near = cell_hash(cells[:, 0] + dx, cells[:, 1] + dy)
+            lo = np.searchsorted(sorted_hashes, near, 'left')
+            counts = np.searchsorted(sorted_hashes, near, 'right') - lo
+            i = np.repeat(np.arange(n), counts)
+            j = order[np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lo, counts)]
+            keep = i < j
+            pairs.append((i[keep], j[keep]))
+    i = np.concatenate([p[0] for p in pairs])
+    j = np.concatenate([p[1] for p in pairs])
+
+    edge = placements['edge']
+    gap = np.linalg.norm(pos[i, :2] - pos[j, :2], axis=1)
+    hit = ((edge[i] != edge[j]) & (gap < rad[i] + rad[j] - 1e-9)
+           & (np.abs(pos[i, 2] - pos[j, 2]) < np.maximum(placements['depth'][i], placements['depth'][j])))
+    return i[hit], j[hit]
+
+
+##
+# Sort out icicles that overlap ones from other edges, mode is one of
+#   NONE   - leave them be
+#   REJECT - drop the lower priority icicle of each overlapping pair
+#   SHRINK - shrink its radius to just touch, dropping it if that's below min_rad
+# Priority goes by edge key then position along the edge, so the result doesn't depend on
+# the order edges were selected or chunked in. placements must be sorted by edge (as
+# place_icicles returns them), keys are the keys of the edges they index
+# If a stats dict is passed, the numbers dropped and shrunk are added to it
+##
+def resolve_overlaps(placements, keys, mode, min_rad, stats=None):
+    if mode == 'NONE' or len(placements) < 2:
+        return placements
+    first, second = overlap_pairs(placements)
+    if not len(first):
+        return placements
+
+    edge = placements['edge']
+    along = np.arange(len(placements)) - np.searchsorted(edge, edge)
+    rank = np.empty(len(placements), dtype=np.int64)
+    rank[np.lexsort((along, np.asarray(keys)[edge]))] = np.arange(len(placements))
+
+    # Each pair as (winner, loser), settled in loser priority order so every winner is final by then
+    swap = rank[first] > rank[second]
+    winner = np.where(swap, second, first)
+    loser = np.where(swap, first, second)
+    order = np.lexsort((rank[winner], rank[loser]))
+
+    xy = placements['position'][:, :2]
+    rad = placements['radius'].copy()
+    keep = np.ones(len(placements), dtype=bool)
+    shrunk = 0
+    for a, b in zip(winner[order].tolist(), loser[order].tolist()):
+        if not (keep[a] and keep[b]):
+            continue
+        room = float(np.hypot(*(xy[a] - xy[b]))) - rad[a]
+        if room >= rad[b]:
+            continue
+        if mode == 'SHRINK' and room >= min_rad:
+            rad[b] = room
+            shrunk += 1
+        else:
+            keep[b] = False
+
+    result = placements.copy()
+    scale = rad / result['radius']
+    result['radius'] = rad
+    result['offset'] *= scale
+    if stats is not None:
+        stats['overlap_dropped'] = stats.get('overlap_dropped', 0) + int((~keep).sum())
+        stats['overlap_shrunk'] = stats.get('overlap_shrunk', 0) + shrunk
+    return result[keep]
+
+
+# Pool entry point, settings come through as a plain tuple so the worker doesn't need this module's classes
+def place_chunk(args):
+    starts, ends, settings, seed, keys = args
+    stats = {}
+    placements, maxed = place_icicles(starts, ends, PlacementSettings(*settings), seed, keys, stats)
+    return placements, maxed, stats
+
+
+##
+# Load this file as a top level 'ig_placement' module
+# Pool workers are plain Python without bpy, so they can't import the add-on package this
+# normally lives in. Functions handed to the pool come from the top level copy instead,
+# which the workers can import straight from this folder
+##
+def standalone_module():
+    import importlib.util
+
+    mod = sys.modules.get('ig_placement')
+    if mod is None:
+        spec = importlib.util.spec_from_file_location('ig_placement', __file__)
+        mod = importlib.util.module_from_spec(spec)
+        sys.modules['ig_placement'] = mod
+        spec.loader.exec_module(mod)
+    return mod
+
+
+##
+# Hide the host's main script while pool workers are started
+# Spawned workers run sys.modules['__main__'] again before anything else, which under
+# blender -b -P is a script importing bpy. With a bare main module in its place they only
+# import what they unpickle (the top level copy of this file)
+##
+@contextmanager
+def bare_main():
+    import types
+
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+
+##
+# Same as place_icicles but split into chunks of edges placed in a process pool
+# Each edge's random stream is derived from the seed and its key, so the merged result is
+# identical to a single serial place_icicles call with the same seed. If the pool can't be
+# started or a worker dies, everything is placed here instead (with stats['pool_failed'] set
+# to the reason when a stats dict is passed)
+##
+def place_icicles_parallel(starts, ends, settings, seed=None, keys=None, chunk_size=5000, workers=None, stats=None):
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 3)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 3)
+    if keys is None:
+        keys = edge_keys(starts, ends)
+    if seed is None:
+        seed = random_seed()
+
+    bounds = list(range(0, len(starts), chunk_size)) + [len(starts)]
+    chunks = [(starts[a:b], ends[a:b], tuple(settings), seed, keys[a:b]) for a, b in zip(bounds, bounds[1:])]
+    if len(chunks) < 2:
+        return place_icicles(starts, ends, settings, seed, keys, stats)
+
+    # Pool machinery is only loaded when it's used, it's not needed to start up
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+    import multiprocessing
+
+    mod = standalone_module()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    # Workers are spawned with a copy of sys.path, so they can find the top level module
+    sys.path.insert(0, folder)
+    try:
+        with bare_main(), ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(mod.place_chunk, chunks))
+    except (BrokenProcessPool, OSError) as e:
+        if stats is not None:
+            stats['pool_failed'] = '{}: {}'.format(type(e).__name__, e)
+        return place_icicles(starts, ends, settings, seed, keys, stats)
+    finally:
+        sys.path.remove(folder)
+
+    # Merge back in chunk order, with edge indices relative to the full edge list
+    for (placements, _, chunk_stats), a in zip(results, bounds):
+        placements['edge'] += a
+        if stats is not None:
+            stats['wasted'] = stats.get('wasted', 0) + chunk_stats.get('wasted', 0)
+    placements = np.concatenate([r[0] for r in results])
+    maxed = np.concatenate([r[1] for r in results])
+    return placements, maxed
@@ -0,0 +1,93 @@
+bl_info = {
+    "name":"Icicle Generator",
+    "author":"Eoin Brennan (Mayeoin Bread)",
+    "version":(2,6),
+    "blender":(2,91,0),
+    "location":"3D View > Tools",
+    "description":"Add icicles of varying widths & heights to selected non-vertical edges",
+    "warning":"",
+    "wiki_url":"",
+    "tracker_url":"",
+    "category":"Add Mesh"
+    }
+
+# Opt-in timing of the generation phases, no bpy needed
+# Where the OS lets the peak resident memory be reset (Linux), each phase's peak is kept too
+
+from contextlib import contextmanager
+import json
+import time
+
+
+##
+# Start a fresh resident memory high-water mark for this process
+# Returns False where that isn't possible, peak_rss then can't be read per phase
+##
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+# Resident memory high-water mark (VmHWM) in bytes, None if there isn't one
+def peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class PhaseTimer:
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = {}
+        self.counts = {}
+        # Peak resident bytes per phase, the biggest of any repeats
+        self.memory = {}
+
+    # Time the body of a with block, repeated phases add up
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        tracked = reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+            peak = peak_rss() if tracked else None
+            if peak is not None:
+                self.memory[name] = max(self.memory.get(name, 0), peak)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        return {'phases': dict(self.phases), 'counts': dict(self.counts), 'peak_rss': dict(self.memory), 'total': self.total}
+
+    # One line summary for Operator.report
+    def summary(self):
+        parts = ['{} {:.3f}s'.format(name, t) for name, t in self.phases.items()]
+        parts += ['{} {}'.format(name, n) for name, n in self.counts.items()]
+        return 'Total {:.3f}s: {}'.format(self.total, ', '.join(parts))
+
+    # Append this run to a JSON lines log
+    def write_json(self, path, **extra):
+        entry = dict(self.as_dict(), time=time.time(), **extra)
+        with open(path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
@@ -0,0 +1,131 @@
+bl_info = {
+    "name":"Icicle Generator",
+    "author":"Eoin Brennan (Mayeoin Bread)",
+    "version":(2,6),
+    "blender":(2,91,0),
+    "location":"3D View > Tools",
+    "description":"Add icicles of varying widths & heights to selected non-vertical edges",
+    "warning":"",
+    "wiki_url":"",
+    "tracker_url":"",
+    "category":"Add Mesh"
+    }
+
+# Tracking for generated icicles
+# Every generated vertex carries int tags, all 0 on the base mesh:
+#   EDGE_TAG     - key of the source edge (ig_placement.edge_keys), low 31 bits
+#   EDGE_HI_TAG  - the rest of the key, read the whole key back with read_edge_keys
+#   SETTINGS_TAG - hash of the settings it was made with
+#   GEN_TAG      - generation (run) it was made in, counts up per object
+#   ID_TAG       - index of the icicle within its generation (1 based)
+# The placements the icicles were built from can be kept on the object as well (STORE_PROP)
+
+import bmesh
+import numpy as np
+
+from . ig_mesh import sync, read_int_attr
+from . ig_placement import STORED_DTYPE, stored_to_ints, ints_to_stored, join_keys, prune_stored
+
+
+# Object property the compact placements (ig_placement.STORED_DTYPE) are kept in
+STORE_PROP = 'icicle_placements'
+
+EDGE_TAG = 'icicle_edge'
+EDGE_HI_TAG = 'icicle_edge_hi'
+SETTINGS_TAG = 'icicle_settings'
+GEN_TAG = 'icicle_gen'
+ID_TAG = 'icicle_id'
+TAGS = (EDGE_TAG, EDGE_HI_TAG, SETTINGS_TAG, GEN_TAG, ID_TAG)
+
+
+def tag_layer(bm, name):
+    layer = bm.verts.layers.int.get(name)
+    if layer is None:
+        layer = bm.verts.layers.int.new(name)
+    return layer
+
+
+def tag_layers(bm):
+    return {name: tag_layer(bm, name) for name in TAGS}
+
+
+##
+# Read one tag for every vertex in bulk
+# In Edit mode the mesh data is synced from the edit mesh first, so indices match bm.verts
+##
+def read_tags(obj, name):
+    sync(obj)
+    return read_int_attr(obj.data, name)
+
+
+# Full source edge key of every vertex, 0 on the base mesh
+def read_edge_keys(obj):
+    return join_keys(read_tags(obj, EDGE_TAG), read_int_attr(obj.data, EDGE_HI_TAG))
+
+
+# Generation and ID tags of every vertex as one int, the same for all verts of an icicle
+def icicle_ids(obj):
+    return (read_tags(obj, GEN_TAG).astype(np.int64) << 32) | read_int_attr(obj.data, ID_TAG).astype(np.int64)
+
+
+# Bump and return the object's generation counter
+def next_generation(obj):
+    gen = obj.get('icicle_generation', 0) + 1
+    obj['icicle_generation'] = gen
+    return gen
+
+
+# Delete the verts (and everything using them) picked out by a mask over bm.verts
+def remove_verts(bm, mask):
+    idx = np.flatnonzero(mask)
+    if not len(idx):
+        return 0
+    bm.verts.ensure_lookup_table()
+    bmesh.ops.delete(bm, geom=[bm.verts[i] for i in idx.tolist()], context='VERTS')
+    return len(idx)
+
+
+##
+# Number of icicles and generations in the tagged verts
+##
+def count_icicles(gen_tags, id_tags):
+    mask = gen_tags != 0
+    pairs = (gen_tags[mask].astype(np.int64) << 32) | id_tags[mask].astype(np.int64)
+    return len(np.unique(pairs)), len(np.unique(gen_tags[mask]))
+
+
+##
+# Placements kept on an object, for the icicles in its mesh
+##
+def read_store(obj):
+    ints = obj.get(STORE_PROP)
+    if ints is None:
+        return np.zeros(0, dtype=STORED_DTYPE)
+    return ints_to_stored(np.array(ints, dtype=np.int32))
+
+
+##
+# Kept placements for the icicles still in obj's mesh, going by the verts' tags
+# Placements of icicles deleted since they were kept (Delete Icicles, by hand) are left out
+##
+def read_kept(obj):
+    return prune_stored(read_store(obj), read_tags(obj, GEN_TAG), read_edge_keys(obj))
+
+
+def write_store(obj, stored):
+    if len(stored):
+        obj[STORE_PROP] = stored_to_ints(stored).tolist()
+    elif STORE_PROP in obj:
+        del obj[STORE_PROP]
+
+
+##
+# The object keeping placements for obj's icicles: obj itself, or its "_icicles" output object
+##
+def store_holder(obj):
+    if STORE_PROP in obj:
+        return obj
+    for child in obj.children:
+        if child.get('icicle_source') == obj.name and STORE_PROP in child:
+            return child
+    return None
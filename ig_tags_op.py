@@ -0,0 +1,101 @@
+bl_info = {
+    "name":"Icicle Generator",
+    "author":"Eoin Brennan (Mayeoin Bread)",
+    "version":(2,6),
+    "blender":(2,91,0),
+    "location":"3D View > Tools",
+    "description":"Add icicles of varying widths & heights to selected non-vertical edges",
+    "warning":"",
+    "wiki_url":"",
+    "tracker_url":"",
+    "category":"Add Mesh"
+    }
+
+from bpy.types import Operator
+from bpy.props import EnumProperty
+
+import numpy as np
+
+from . ig_mesh import selected_edges, open_bmesh, close_bmesh
+from . ig_placement import edge_keys
+from . ig_tags import (
+    GEN_TAG,
+    ID_TAG,
+    read_tags,
+    read_edge_keys,
+    read_kept,
+    write_store,
+    remove_verts,
+    count_icicles
+)
+
+
+class WM_OT_DeleteIcicles(Operator):
+    bl_idname = 'wm.delete_icicles'
+    bl_label = 'Delete Icicles'
+    bl_description = 'Delete generated icicles, the base mesh is left alone'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    scope: EnumProperty(
+        name='Delete',
+        items=[
+            ('ALL', 'All', 'Every generated icicle'),
+            ('LAST', 'Last generation', 'Icicles from the most recent generation'),
+            ('SELECTED', 'Selected edges', 'Icicles generated from the selected edges')
+        ],
+        default='ALL'
+    )
+
+    @classmethod
+    def poll(cls, context):
+        ob = context.object
+        return ob is not None and ob.type == 'MESH'
+
+    # Mask over the verts of the icicles to remove, edge_tags are their full source edge keys
+    def pick(self, obj, edge_tags):
+        if self.scope == 'ALL':
+            return edge_tags != 0
+        if self.scope == 'LAST':
+            gen_tags = read_tags(obj, GEN_TAG)
+            return (gen_tags != 0) & (gen_tags == gen_tags.max(initial=0))
+
+        # Source edges are matched by key, from the selected base edges
+        edge_set = selected_edges(obj, 0.0)
+        keys = edge_keys(edge_set.starts, edge_set.ends)
+        return (edge_tags != 0) & np.isin(edge_tags, keys)
+
+    def execute(self, context):
+        obj = context.object
+        edge_tags = read_edge_keys(obj)
+        mask = self.pick(obj, edge_tags)
+        if not mask.any():
+            self.report({'INFO'}, "No icicles to delete")
+            return {'CANCELLED'}
+
+        count, _ = count_icicles(read_tags(obj, GEN_TAG)[mask], read_tags(obj, ID_TAG)[mask])
+        bm = open_bmesh(obj)
+        remove_verts(bm, mask)
+        close_bmesh(obj, bm)
+        # Kept placements go with their icicles, so Rebuild/Export/preview don't bring them back
+        write_store(obj, read_kept(obj))
+
+        self.report({'INFO'}, "Deleted {} icicles".format(count))
+        return {'FINISHED'}
+
+
+class WM_OT_CountIcicles(Operator):
+    bl_idname = 'wm.count_icicles'
+    bl_label = 'Count Icicles'
+    bl_description = 'Report how many generated icicles are on the active object'
+    bl_options = {'REGISTER'}
+
+    @classmethod
+    def poll(cls, context):
+        ob = context.object
+        return ob is not None and ob.type == 'MESH'
+
+    def execute(self, context):
+        obj = context.object
+        count, gens = count_icicles(read_tags(obj, GEN_TAG), read_tags(obj, ID_TAG))
+        self.report({'INFO'}, "{} icicles from {} generations".format(count, gens))
+        return {'FINISHED'}